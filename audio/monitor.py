@@ -1,10 +1,30 @@
-import queue, threading, numpy as np, sounddevice as sd
+import threading, numpy as np, sounddevice as sd
+from iodev.ring import SpscRing, next_pow2
+from .pcm import int16_to_float32, keep_ringbuffer_playing
+
+# Prefer rtmixer (C audio callback, no GIL on the audio thread).
+# If it's not installed, fall back to a write-based sounddevice stream.
+try:
+    import rtmixer
+except ImportError:
+    rtmixer = None
+
 
 class Monitor:
     """
     Live monitoring: reads raw int16 mono bytes from a reader and plays them out.
     - out_device: explicitly choose your AV jack device (e.g., index 2 on your Pi)
     - blocksize: keep this equal to your READ_CHUNK / AUDIO_BLOCK_SAMPLES
+
+    Playback runs through rtmixer: the audio callback is implemented in C and
+    copies straight out of a lock-free PortAudio ring buffer, so no Python code
+    (and no GIL) runs on the realtime audio thread.
+    Without rtmixer, a writer thread feeds a blocking (callback-less) OutputStream,
+    which also keeps Python off the audio thread.
+
+    reader.read_into(buf) must block in C with the GIL released (SerialAudioReader
+    does). The reader thread passes it preallocated memory (a span of the ring on
+    the fallback path), so no bytes object is created per chunk.
     """
     def __init__(self, fs: int, reader_factory, blocksize: int, on_error=None, out_device=None):
         # Save constructor parameters for later use
@@ -16,116 +36,172 @@ class Monitor:
         # Thread control and shared state
         self._stop = threading.Event()   # used to stop all threads
         self._t_reader = None            # background thread that pulls bytes from the reader
-        self._t_pump = None              # background thread that moves bytes into the play buffer
+        self._t_writer = None            # fallback only: thread that blocks in stream.write()
 
-        # Producer/consumer data structures
-        self._q = queue.Queue(maxsize=64)   # reader_thread puts raw byte chunks here
-        self._buf = bytearray()             # pump_thread appends here; audio callback consumes from here
+        # Will hold the rtmixer output stream, its ring buffer and the playback action
+        self._mixer = None
+        self._rb = None
+        self._action = None
 
-        # Will hold the sounddevice output stream
+        # Fallback path: lock-free SPSC ring (~0.5 s of int16 bytes) between
+        # reader_thread (producer) and writer_thread (consumer)
+        self._ring = SpscRing(next_pow2(fs // 2) * 2)
         self._stream = None
 
-    # Audio callback: sounddevice calls this regularly to fill the output buffer
-    def _audio_cb(self, outdata, frames, time_info, status):
-        try:
-            # We need 2 bytes per mono int16 frame
-            need = frames * 2
-            # If we don't have enough data, output silence
-            if len(self._buf) < need:
-                outdata[:] = 0
-                return
-            # Take exactly the bytes we need and remove them from the buffer
-            chunk = self._buf[:need]
-            del self._buf[:need]
-            # OutputStream with dtype='int16' expects int16 samples in outdata[:, 0]
-            outdata[:, 0] = np.frombuffer(chunk, dtype=np.int16)
-        except Exception:
-            # Fail-safe: output silence if anything goes wrong in the callback
-            outdata[:] = 0
-
-    # Background thread: continuously read raw bytes from the reader and queue them
+    # Background thread: continuously read raw bytes from the reader and push them into the ring
     def _reader_thread(self):
+        # rtmixer path: raw int16 bytes and their float32 conversion, both allocated once
+        raw = np.empty(self.fs * 2, dtype=np.uint8)
+        scratch = np.empty(self.fs, dtype=np.float32)
+        odd = 0     # 1 if raw[0] holds the trailing byte of an odd-length read
+        mixer, rb = self._mixer, self._rb   # stop() drops the attributes while we may still run
         try:
-            # reader_factory must return a context manager that yields an object with read_bytes()
+            # reader_factory must return a context manager that yields an object with read_into()
             with self.reader_factory() as reader:
                 while not self._stop.is_set():
-                    raw = reader.read_bytes()
-                    if raw:
-                        try:
-                            self._q.put_nowait(raw)  # do not block; drop if queue is full
-                        except queue.Full:
-                            pass
+                    if rb is not None:
+                        got = reader.read_into(raw[odd:])
+                        if not got:
+                            continue
+                        total = odd + got
+                        n = total // 2
+                        # rtmixer mixes in float32; convert in one vectorized pass, off the audio thread
+                        frames = int16_to_float32(raw[:n * 2].view(np.int16), scratch)
+                        # C-level memcpy into the ring; drops what doesn't fit when full
+                        rb.write(frames)
+                        # Start playback once prefilled, and again after an underrun
+                        self._action = keep_ringbuffer_playing(mixer, rb, self._action, self.blocksize)
+                        odd = total - n * 2
+                        if odd:
+                            raw[0] = raw[total - 1]
+                    else:
+                        # Read straight into the ring's free space; publish what arrived
+                        span = self._ring.write_span()
+                        if span.size:
+                            self._ring.commit(reader.read_into(span))
+                        else:
+                            # Ring full (writer fell behind): read and drop this chunk
+                            reader.read_into(raw)
         except Exception as e:
+            # Teardown in stop() (closed mixer/reader) is not an error
+            if self._stop.is_set():
+                return
             # Report errors to the optional handler and stop everything
             if self.on_error:
                 self.on_error(e)
             self._stop.set()
 
-    # Background thread: move queued chunks into the playback buffer that the audio callback reads
-    def _pump_thread(self):
+    # Fallback background thread: blocking writes; PortAudio paces us from C
+    def _writer_thread(self):
+        # One (frames, channels) int16 block, reused for every write; the ring copies
+        # straight into its bytes (OutputStream with dtype='int16' expects this shape)
+        block = np.zeros((self.blocksize, 1), dtype=np.int16)
+        block_bytes = block.view(np.uint8).reshape(-1)
+        stream = self._stream   # stop() may drop self._stream while we're still running
         try:
             while not self._stop.is_set():
-                try:
-                    raw = self._q.get(timeout=0.1)  # wait briefly for data
-                except queue.Empty:
-                    continue
-                if raw:
-                    self._buf.extend(raw)  # append to the playback buffer
+                if not self._ring.read_into(block_bytes):
+                    # Not enough data yet: play silence so the stream keeps its pace
+                    block.fill(0)
+                stream.write(block)
         except Exception as e:
-            # Report errors and stop
+            # abort()/close() in stop() unblock write(); that is not an error
+            if self._stop.is_set():
+                return
             if self.on_error:
                 self.on_error(e)
             self._stop.set()
 
-    # Start live monitoring: spin up threads and open the audio output stream
+    # Open the rtmixer output with a ring buffer the C callback plays from
+    def _start_mixer(self):
+        # Open audio output on the explicit device (e.g., AV jack)
+        self._mixer = rtmixer.Mixer(
+            samplerate=self.fs,
+            channels=1,
+            blocksize=self.blocksize,
+            latency='low',
+            device=self.out_device  # IMPORTANT: ensures playback goes to the chosen device
+        )
+
+        # ~0.5 s of float32 mono frames; the C callback reads directly from here.
+        # Playback starts from the reader thread once the ring is prefilled: rtmixer
+        # would drop an action started on an empty ring at the first callback
+        self._rb = rtmixer.RingBuffer(elementsize=4, size=next_pow2(self.fs // 2))
+        self._mixer.start()
+        self._action = None
+
+    # Fallback: open a callback-less OutputStream and a writer thread that feeds it
+    def _start_stream(self):
+        self._stream = sd.OutputStream(
+            samplerate=self.fs,
+            channels=1,
+            dtype='int16',
+            blocksize=self.blocksize,
+            latency='low',
+            device=self.out_device  # IMPORTANT: ensures playback goes to the chosen device
+        )
+        self._stream.start()
+        self._t_writer = threading.Thread(target=self._writer_thread, daemon=True)
+        self._t_writer.start()
+
+    # Start live monitoring: open the audio output, then spin up the reader
     def start(self):
         try:
             self._stop.clear()
 
-            # Start the producer (reader) and the pump threads
+            if rtmixer is not None:
+                self._start_mixer()
+            else:
+                self._start_stream()
+
+            # Start the producer (reader) thread
             self._t_reader = threading.Thread(target=self._reader_thread, daemon=True)
             self._t_reader.start()
-            self._t_pump = threading.Thread(target=self._pump_thread, daemon=True)
-            self._t_pump.start()
-
-            # Open audio output on the explicit device (e.g., AV jack)
-            self._stream = sd.OutputStream(
-                samplerate=self.fs,
-                channels=1,
-                dtype='int16',
-                callback=self._audio_cb,
-                blocksize=self.blocksize,
-                latency='low',
-                device=self.out_device  # IMPORTANT: ensures playback goes to the chosen device
-            )
-            self._stream.start()
             print(f"[monitor] started (device={self.out_device})")
         except Exception as e:
             print(f"[monitor] start failed: {e}")
             if self.on_error:
                 self.on_error(e)
 
-    # Stop live monitoring: stop audio, join threads, and clear buffers
+    # Stop live monitoring: stop the threads, cancel playback and close the output
     def stop(self):
         self._stop.set()
 
-        # Stop and close the audio stream if it exists
+        # Release the output device first: stop() may run on the reader thread
+        # itself (on_error), and nothing below may be skipped in that case.
+        # Abort (not stop) the blocking stream so a pending write() returns at once
         if self._stream:
             try:
-                self._stream.stop()
+                self._stream.abort()
                 self._stream.close()
             except Exception:
                 pass
             self._stream = None
 
-        # Join background threads (give them a short timeout)
+        # Cancel playback and close the audio stream if it exists
+        if self._mixer:
+            try:
+                if self._action is not None and self._action in self._mixer.actions:
+                    self._mixer.cancel(self._action)
+                self._mixer.stop()
+                self._mixer.close()
+            except Exception:
+                pass
+            self._mixer = None
+        self._action = None
+
+        # Then join the background threads (a thread can't join itself)
+        current = threading.current_thread()
         if self._t_reader:
-            self._t_reader.join(timeout=1.0)
+            if self._t_reader is not current:
+                self._t_reader.join(timeout=1.0)
             self._t_reader = None
-        if self._t_pump:
-            self._t_pump.join(timeout=1.0)
-            self._t_pump = None
+        if self._t_writer:
+            if self._t_writer is not current:
+                self._t_writer.join(timeout=1.0)
+            self._t_writer = None
 
-        # Clear playback buffer for a clean next start
-        self._buf.clear()
+        # Drop buffered audio for a clean next start
+        self._rb = None
+        self._ring.clear()
         print("[monitor] stopped")
@@ -0,0 +1,36 @@
+import numpy as np
+
+# int16 full scale -> float32 in [-1.0, 1.0)
+PCM16_SCALE = np.float32(1.0 / 32768.0)
+
+
+def int16_to_float32(src, out: np.ndarray) -> np.ndarray:
+    """
+    Convert int16 PCM (an int16 array, or bytes/memoryview of int16 samples) to
+    float32 into the preallocated `out`, in one vectorized pass; no temporaries.
+    Returns out[:n], a view that is overwritten by the next call with the same `out`.
+    Bundle preprocessors can use this too: allocate `out` once in build_preprocessor().
+    """
+    samples = src if isinstance(src, np.ndarray) else np.frombuffer(src, dtype=np.int16)
+    frames = out[:samples.size]
+    np.multiply(samples, PCM16_SCALE, out=frames, casting='unsafe')
+    return frames
+
+
+# rtmixer drops a play_ringbuffer() action as soon as its ring holds less than one
+# block (underrun); playback is (re)started only once this many blocks are queued
+PREFILL_BLOCKS = 2
+
+
+def keep_ringbuffer_playing(mixer, rb, action, blocksize: int):
+    """
+    Call after each write into an rtmixer RingBuffer. Returns the action playing `rb`:
+    `action` while it is still active, a new play_ringbuffer() action once rtmixer
+    has dropped it (or never started one) and PREFILL_BLOCKS blocks are buffered,
+    else None (still prefilling).
+    """
+    if action is not None and action in mixer.actions:
+        return action
+    if rb.read_available >= blocksize * PREFILL_BLOCKS:
+        return mixer.play_ringbuffer(rb)
+    return None
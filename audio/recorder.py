@@ -2,15 +2,46 @@ import numpy as np
 import os
 import time
 from datetime import datetime
-from scipy.io.wavfile import write
+from .wav import write_wav
+from iodev.ring import next_pow2
+from .pcm import int16_to_float32, keep_ringbuffer_playing
 import sounddevice as sd
 
+# Prefer rtmixer: writes become a non-blocking memcpy into a ring the C callback plays from.
+# If it's not installed, fall back to a (blocking) raw sounddevice stream.
+try:
+    import rtmixer
+except ImportError:
+    rtmixer = None
+
 class AudioTap:
     """
     Plays raw int16 mono bytes directly to the selected audio device.
     Use this to monitor (hear) the microphone while recording.
+
+    With rtmixer, write() never blocks the capture loop: samples go into a ~1 s
+    ring buffer and anything that doesn't fit is dropped and counted in `dropped`.
     """
     def __init__(self, fs: int, device=None, blocksize=1024):
+        self.dropped = 0          # frames that didn't fit in the ring (rtmixer path)
+        self._s = None
+        self._m = None
+        self._rb = None
+        self._action = None
+        self._blocksize = blocksize
+
+        if rtmixer is not None:
+            # Output mixer (float32 only) playing from a ring buffer we fill in write()
+            self._m = rtmixer.Mixer(
+                samplerate=fs, channels=1,
+                blocksize=blocksize, latency='low', device=device
+            )
+            self._rb = rtmixer.RingBuffer(elementsize=4, size=next_pow2(fs))
+            self._scratch = np.empty(blocksize, dtype=np.float32)  # reused for int16 -> float32
+            self._m.start()
+            # Playback starts in write() once the ring is prefilled (see keep_ringbuffer_playing)
+            return
+
         # Create a raw output stream (mono, 16-bit) for low-latency monitoring
         self._s = sd.RawOutputStream(
             samplerate=fs, channels=1, dtype='int16',
@@ -19,16 +50,37 @@ class AudioTap:
         # Start the audio stream immediately
         self._s.start()
 
-    def write(self, raw: bytes):
-        # Push raw bytes to the output device if data is present
-        if raw:
-            self._s.write(raw)
+    def write(self, mv: memoryview):
+        # Push raw int16 bytes (any buffer, e.g. a view into a recording) to the output device
+        if not len(mv):
+            return
+        if self._rb is None:
+            self._s.write(mv)
+            return
+
+        samples = np.frombuffer(mv, dtype=np.int16)
+        n = samples.size
+        if n > self._scratch.size:
+            self._scratch = np.empty(n, dtype=np.float32)
+        frames = int16_to_float32(samples, self._scratch)
+        # C-level memcpy, never blocks; count what doesn't fit instead of waiting
+        self.dropped += n - self._rb.write(frames)
+        # Start playback once prefilled, and again after an underrun
+        self._action = keep_ringbuffer_playing(self._m, self._rb, self._action, self._blocksize)
 
     def close(self):
         # Safely stop and close the output stream
         try:
-            self._s.stop()
-            self._s.close()
+            if self._m:
+                if self._action is not None and self._action in self._m.actions:
+                    self._m.cancel(self._action)
+                self._m.stop()
+                self._m.close()
+                if self.dropped:
+                    print(f"[tap] dropped {self.dropped} frames (playback fell behind)")
+            else:
+                self._s.stop()
+                self._s.close()
         except Exception:
             # Ignore teardown errors; we’re shutting down anyway
             pass
@@ -43,7 +95,7 @@ class Recorder:
     def __init__(self, fs: int, reader_factory, output_dir_fn, out_device=None, blocksize=1024):
         # Store configuration
         self.fs = fs
-        self.reader_factory = reader_factory     # must return a context manager with read_bytes()
+        self.reader_factory = reader_factory     # must return a context manager with read_into()
         self.output_dir_fn = output_dir_fn       # callable that returns the output directory path
         self.out_device = out_device             # sounddevice output device index/name for monitoring
         self.blocksize = blocksize               # audio block size to keep latency stable
@@ -51,12 +103,16 @@ class Recorder:
     def record_seconds(self, seconds: int) -> str | None:
         """
         Record for a fixed duration.
-        - Reads raw bytes from the reader.
-        - Feeds the same bytes into AudioTap to monitor while recording.
-        - Converts to int16 array and writes a WAV file.
+        - Reads raw bytes from the reader straight into one preallocated int16 array.
+        - Feeds the newly completed samples into AudioTap to monitor while recording.
+        - Writes the filled part of the array as a WAV file.
         Returns the saved file path or None on failure.
         """
-        buf = bytearray()        # accumulates all raw bytes for this take
+        total = self.fs * seconds                  # samples we expect for this take
+        data = np.empty(total, dtype=np.int16)     # single allocation, filled by the reader
+        buf = data.view(np.uint8)                  # the same memory as bytes (read_into target)
+        got = 0                                    # bytes stored so far (may end mid-sample)
+        n = 0                                      # whole samples stored so far
         tap = None               # will hold the AudioTap for live monitoring
         start = time.monotonic() # monotonic clock to measure duration accurately
 
@@ -67,11 +123,16 @@ class Recorder:
                 tap = AudioTap(self.fs, device=self.out_device, blocksize=self.blocksize)
 
                 # Keep reading until the requested number of seconds has passed
-                while time.monotonic() - start < seconds:
-                    raw = reader.read_bytes()  # get the next raw chunk (may be empty)
-                    if raw:
-                        buf.extend(raw)        # store for saving
-                        tap.write(raw)         # monitor while recording
+                # (or the buffer is full)
+                while n < total and time.monotonic() - start < seconds:
+                    # Read the next chunk directly behind what we have (no bytes object);
+                    # an odd-length read is completed in place by the next one
+                    got += reader.read_into(buf[got:])
+                    m = got // 2
+                    if m > n:
+                        # Monitor while recording: play the new samples (a view, no copy)
+                        tap.write(memoryview(data[n:m]).cast("B"))
+                        n = m
         except Exception as e:
             # Reader failures (e.g., serial disconnect) are reported and we abort
             print(f"[record] Serial error: {e}")
@@ -81,15 +142,10 @@ class Recorder:
             if tap:
                 tap.close()
 
-        # Convert accumulated bytes to int16 mono samples
-        n = len(buf) // 2  # 2 bytes per int16 sample
         if n == 0:
             print("[record] No data; got 0 samples")
             return None
 
-        # Build a NumPy array without copying more than needed
-        data = np.frombuffer(memoryview(buf)[: n * 2], dtype=np.int16)
-
         # Construct an output file path with a readable timestamp
         ts = datetime.now().strftime("T%H_%M_%S_D%d_%m_%Y")
         outdir = self.output_dir_fn()
@@ -98,7 +154,7 @@ class Recorder:
 
         # Write the WAV file; on error, report and abort
         try:
-            write(path, self.fs, data)
+            write_wav(path, self.fs, data[:n])
         except Exception as e:
             print(f"[record] Save failed: {e}")
             return None
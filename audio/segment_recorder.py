@@ -1,53 +1,116 @@
-import os, threading, numpy as np
-from datetime import datetime
-from scipy.io.wavfile import write
+import os, queue, threading, time, numpy as np
+from typing import Final
+from .wav import write_wav
 from .recorder import AudioTap  # NOTE: relative import within the same package
 
+# Prefer Numba for the per-chunk copy kernel (compiled, runs without the GIL).
+# If it's not installed, the same function runs as plain NumPy slicing.
+try:
+    from numba import njit
+except ImportError:
+    def njit(*args, **kwargs):
+        return lambda fn: fn
+
+
+@njit(cache=True, nogil=True)
+def _fill(seg, w, samples, start):
+    # Copy as many samples as fit from samples[start:] into seg[w:]; return the count
+    take = min(samples.size - start, seg.size - w)
+    seg[w:w + take] = samples[start:start + take]
+    return take
+
 class SegmentRecorder:
     """
     Continuously reads raw int16 mono bytes from a reader and:
       - Plays them live to a chosen output device (monitoring)
       - Slices the stream into fixed-length segments
       - Saves each segment as a WAV file with a timestamped name
+
+    Saving happens on a separate writer thread, so SD-card/USB flush stalls
+    never hold up reading from the serial stream.
     """
+    N_BUFFERS = 3   # one being filled + up to two waiting for / being written
     def __init__(self, fs: int, reader_factory, output_dir_fn,
-                 segment_seconds: int = 10, on_error=None, out_device=None, blocksize=1024):
+                 segment_seconds: int = 10, on_error=None, out_device=None, blocksize=1024,
+                 preallocate: bool = False):
         # Save configuration parameters
-        self.fs = fs                                # sample rate (Hz)
-        self.reader_factory = reader_factory        # callable -> context manager with read_bytes()
+        self.fs: Final[int] = fs                    # sample rate (Hz)
+        self.reader_factory = reader_factory        # callable -> context manager with read_into()
         self.output_dir_fn = output_dir_fn          # callable that returns directory path for output
-        self.segment_seconds = segment_seconds      # length of each WAV segment in seconds
-        self.segment_bytes = fs * segment_seconds * 2  # bytes per segment (2 bytes per int16 sample)
+        self.segment_seconds: Final[int] = segment_seconds  # length of each WAV segment in seconds
+        self.segment_samples: Final[int] = fs * segment_seconds  # int16 samples per segment
         self.on_error = on_error                    # optional error callback
         self.out_device = out_device                # output device index/name for live monitoring
         self.blocksize = blocksize                  # audio block size used by AudioTap
+        self.preallocate = preallocate              # reserve each WAV file's size before writing
 
         # Runtime state
         self._stop = threading.Event()              # set to request the worker thread to stop
         self._t = None                              # background worker thread handle
-        self._buf = bytearray()                     # rolling buffer of raw bytes awaiting segmentation
+        self._writer_t = None                       # thread that saves finished segments
         self._tap = None                            # AudioTap for live monitoring
 
-    # Convert raw bytes into int16 samples and save as a timestamped WAV file
-    def _write_segment(self, raw_bytes: bytes):
-        n = len(raw_bytes) // 2                     # number of int16 samples in the chunk
+        # Preallocated int16 segment buffers: the reader fills one while finished ones
+        # wait in _write_q; the writer hands each buffer back via _free once saved
+        self._free = queue.Queue()
+        for _ in range(self.N_BUFFERS):
+            self._free.put(np.empty(self.segment_samples, dtype=np.int16))
+        self._write_q = queue.Queue(maxsize=self.N_BUFFERS)  # (timestamp, buffer) or None to stop
+        self._seg = None                            # buffer being filled
+        self._w = 0                                 # samples written into the current buffer
+        self._raw = np.empty(fs * 2, dtype=np.uint8)  # reused read_into() target (~1 s)
+        self._odd = 0                               # 1 if _raw[0] holds the trailing byte of an odd read
+        self._outdir = None                         # resolved (and created) once per start()
+
+    # Save one full segment of int16 samples as a timestamped WAV file
+    def _write_segment(self, data: np.ndarray, ts: str):
+        n = data.size                               # number of int16 samples in the segment
         if n == 0:
             return
-        data = np.frombuffer(memoryview(raw_bytes)[: n * 2], dtype=np.int16)
 
-        # Build output path: directory exists or is created; filename includes time and date
-        ts = datetime.now().strftime("T%H_%M_%S_D%d_%m_%Y")
-        outdir = self.output_dir_fn()
-        os.makedirs(outdir, exist_ok=True)
-        path = os.path.join(outdir, f"seg_{ts}.wav")
+        # Build output path in the session directory; filename includes time and date
+        path = os.path.join(self._outdir, f"seg_{ts}.wav")
 
         # Write the WAV file with the configured sample rate
-        write(path, self.fs, data)
+        write_wav(path, self.fs, data, preallocate=self.preallocate)
         print(f"[segrec] Saved: {path} ({n} samples, {(n/self.fs):.2f}s)")
 
+    # Background writer: save queued segments, then recycle their buffers
+    def _writer_loop(self):
+        while True:
+            item = self._write_q.get()
+            if item is None:                        # sentinel from stop()
+                return
+            ts, seg = item
+            try:
+                self._write_segment(seg, ts)
+            except Exception as e:
+                # Report error to caller (if provided) and request stop
+                if self.on_error:
+                    self.on_error(e)
+                self._stop.set()
+            finally:
+                self._free.put(seg)
+
+    # Copy incoming samples into the current segment buffer; queue it for saving when full
+    def _append(self, samples: np.ndarray):
+        i, n = 0, samples.size
+        while i < n:
+            if self._seg is None:
+                # Blocks only if the writer is a whole N_BUFFERS - 1 segments behind
+                self._seg = self._free.get()
+            take = _fill(self._seg, self._w, samples, i)
+            self._w += take
+            i += take
+            if self._w == self.segment_samples:
+                # Timestamp when the segment ends, not when the writer gets to it
+                ts = time.strftime("T%H_%M_%S_D%d_%m_%Y", time.localtime())
+                self._write_q.put((ts, self._seg))
+                self._seg = None
+                self._w = 0
+
     # Main background loop: read -> optional monitor -> accumulate -> slice -> save
     def _loop(self):
-        import time
         try:
             # Open the reader that provides raw audio bytes
             with self.reader_factory() as reader:
@@ -56,19 +119,25 @@ class SegmentRecorder:
 
                 # Keep pulling data until stop is requested
                 while not self._stop.is_set():
-                    raw = reader.read_bytes()
-                    if raw:
-                        # Hear the audio while segmenting (live monitoring)
+                    # Read into the reused buffer, behind a carried odd byte if any
+                    raw = self._raw
+                    got = reader.read_into(raw[self._odd:])
+                    if got:
+                        total = self._odd + got
+                        n = total // 2
+                        samples = raw[:n * 2].view(np.int16)
+
+                        # Hear the audio while segmenting (live monitoring), whole frames only
                         if self._tap:
-                            self._tap.write(raw)
-                        # Add incoming bytes to the rolling buffer
-                        self._buf.extend(raw)
-
-                        # If buffer has at least one full segment, cut and save it
-                        while len(self._buf) >= self.segment_bytes:
-                            seg = bytes(self._buf[:self.segment_bytes])  # copy exact segment
-                            del self._buf[:self.segment_bytes]           # remove it from buffer
-                            self._write_segment(seg)
+                            self._tap.write(memoryview(samples).cast("B"))
+
+                        # One int16 view per chunk, copied straight into the segment buffer
+                        self._append(samples)
+
+                        # Keep int16 alignment across odd-length reads
+                        self._odd = total - n * 2
+                        if self._odd:
+                            raw[0] = raw[total - 1]
         except Exception as e:
             # Report error to caller (if provided) and request stop
             if self.on_error:
@@ -82,25 +151,49 @@ class SegmentRecorder:
                 finally:
                     self._tap = None
 
-    # Start the background segmentation thread (no-op if already running)
+    # Return the partially filled buffer (if any) to the free pool
+    def _drop_partial(self):
+        if self._seg is not None:
+            self._free.put(self._seg)
+            self._seg = None
+        self._w, self._odd = 0, 0
+
+    # Start the background segmentation and writer threads (no-op if already running)
     def start(self):
         if self._t and self._t.is_alive():
             return
         self._stop.clear()
+        self._drop_partial()
+        # Resolve and create the output directory once per session, not per segment
+        self._outdir = self.output_dir_fn()
+        os.makedirs(self._outdir, exist_ok=True)
+        self._writer_t = threading.Thread(target=self._writer_loop, daemon=True)
+        self._writer_t.start()
         self._t = threading.Thread(target=self._loop, daemon=True)
         self._t.start()
         print("[segrec] started")
 
-    # Stop the worker, close monitoring, and clear buffers
+    # Stop the worker, close monitoring, flush finished segments, and clear buffers
     def stop(self):
         self._stop.set()
-        if self._t:
-            self._t.join(timeout=1.0)
-            self._t = None
-        if self._tap:
-            try:
-                self._tap.close()
-            finally:
-                self._tap = None
-        self._buf.clear()
+        # on_error may call stop() from the reader or writer thread itself: never join that one
+        current = threading.current_thread()
+        try:
+            if self._t:
+                if self._t is not current:
+                    self._t.join(timeout=1.0)
+                self._t = None
+            if self._tap:
+                try:
+                    self._tap.close()
+                finally:
+                    self._tap = None
+        finally:
+            # Let the writer save what is already queued, then exit (always, or it leaks)
+            if self._writer_t:
+                self._write_q.put(None)
+                if self._writer_t is not current:
+                    self._writer_t.join(timeout=5.0)
+                self._writer_t = None
+        self._drop_partial()                        # drop the unfinished segment
         print("[segrec] stopped")
@@ -1,5 +1,15 @@
 from dataclasses import dataclass
 import os
+import sys
+
+# True when running on a free-threaded CPython build (3.13t+, no GIL).
+# Then Monitor's reader/writer threads and the PortAudio callback really run
+# in parallel on the Pi's cores. Plain numpy stores give no ordering without the
+# GIL (ARM64 is weakly ordered), so the rings in iodev/ring.py publish their
+# counters under a lock (threading.Lock in-process, multiprocessing.Lock across
+# processes); it is held only for the counter update, never during copies.
+# Note: numpy must be >= 2.1 for free-threaded builds.
+FREE_THREADED: bool = "t" in getattr(sys, "abiflags", "")
 
 @dataclass(frozen=True)
 class Config:
@@ -22,12 +32,28 @@ class Config:
     # Number of bytes to read from the serial stream per chunk
     READ_CHUNK_BYTES: int = int(os.getenv("READ_CHUNK_BYTES", 4096))
 
+    # Run the serial reader in a separate process (shared-memory hand-off, own GIL)
+    READER_PROCESS: bool = os.getenv("READER_PROCESS", "0") == "1"
+
+    # Run model loading + inference in a separate process (own GIL); LEDs drawn here
+    PREDICT_PROCESS: bool = os.getenv("PREDICT_PROCESS", "0") == "1"
+
+    # Windows per model invoke() in the predict loop (1 = predict_one; >1 batches via
+    # a resized interpreter: more throughput, but the LEDs update once per batch)
+    PRED_BATCH: int = int(os.getenv("PRED_BATCH", 1))
+
+    # TFLite CPU threads (XNNPACK's NEON kernels use them on builds that include it)
+    TFLITE_THREADS: int = int(os.getenv("TFLITE_THREADS", os.cpu_count() or 1))
+
     # Number of samples in one small audio block (used for playback buffering)
     AUDIO_BLOCK_SAMPLES: int = int(os.getenv("AUDIO_BLOCK_SAMPLES", 1024))
 
     # Length (in seconds) of one segment in continuous recording mode
     SEGMENT_SECONDS: int = int(os.getenv("SEGMENT_SECONDS", 10))
 
+    # Preallocate segment WAV files (posix_fallocate); enable for ext4, not for FAT32 sticks
+    WAV_PREALLOCATE: bool = os.getenv("WAV_PREALLOCATE", "0") == "1"
+
     # Default output device name for audio playback (e.g., “Headphones”)
     AUDIO_OUT_DEVICE: str = os.getenv("AUDIO_OUT_DEVICE", "Headphones")
 
@@ -45,6 +71,8 @@ COLORS = {
     "CYAN":   (0, 200, 255),    # Live monitoring
     "ORANGE": (255, 165, 0),    # Continuous segment recording
     "WHITE":  (255, 255, 255),  # Prediction border / neutral color
+    "BLUE":   (0, 0, 255),      # Waiting for the model to finish loading
+    "OFF":    (0, 0, 0),        # All LEDs off (shutdown)
 }
 
 # 10 class colors used for different prediction categories
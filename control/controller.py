@@ -1,11 +1,52 @@
 # control/controller.py
 import os
 import sys
+import queue
+import logging
 import threading
-import time
+import multiprocessing as mp
+from enum import IntEnum
 from typing import Callable, Tuple, Optional, List
 import numpy as np
 
+# Handlers are set up by main.py (a QueueHandler, so logging never blocks on the terminal)
+log = logging.getLogger("ctl")
+
+
+class S(IntEnum):
+    """Controller states (str(S.IDLE) == "idle" for logs)."""
+    IDLE = 0
+    ERROR = 1
+    MONITORING = 2
+    CONTINUOUS = 3
+    PREDICT = 4
+    RECORDING = 5
+
+    def __str__(self):
+        return self.name.lower()
+
+
+def _predict_worker(load_model_bundle_fn, out_q, stop_ev):
+    """
+    Prediction process body: load the bundle here (the TFLite interpreter must not
+    be shared across a fork) and stream class indices back to the parent (the LEDs
+    only show the class, so no probabilities are computed or pickled).
+    Runs under its own GIL, so feature extraction and inference don't time-slice
+    with the audio threads. Errors are sent back as ("error", message).
+    """
+    try:
+        predictor, get_input_fn = load_model_bundle_fn()
+        while not stop_ev.is_set():
+            cls_idx = predictor.predict_class_inplace(get_input_fn)
+            try:
+                out_q.put_nowait(("pred", cls_idx, None))
+            except queue.Full:
+                # Parent is behind on drawing; newer results follow anyway
+                pass
+    except Exception as e:
+        out_q.put(("error", f"{type(e).__name__}: {e}", None))
+
+
 class Controller:
     """
     Connects the UI (Sense HAT LEDs) with the audio features:
@@ -24,7 +65,13 @@ class Controller:
         load_model_bundle_fn: Callable[[], Tuple[object, Callable[[], "np.ndarray"]]],
         seconds: int,
         segment_seconds: int,
-        class_palette: List[tuple]
+        class_palette: List[tuple],
+        input_ready: Optional[threading.Event] = None,  # set by the reader when new audio arrived
+        predict_in_process: bool = False,               # run load + inference in a child process
+        pred_join_timeout: float = 2.0,                 # how long stop waits for the predict thread
+        on_restart: Optional[Callable[[], None]] = None, # e.g. stop the log listener before execv
+        pred_batch: int = 1,                            # >1: run this many windows per invoke()
+        reset_audio: Optional[Callable[[], None]] = None # reopen the shared audio reader (soft reset)
     ):
         # Save dependencies and configuration
         self.ui = ui
@@ -37,45 +84,105 @@ class Controller:
         self._palette = class_palette
 
         # Current high-level state of the controller
-        self.state = "idle"
+        self.state = S.IDLE
 
         # Prediction runtime state (lazy-initialized when first used)
         self._predictor = None            # model wrapper with .predict_one(...)
         self._get_input_fn = None         # callable that returns the model input
         self._model_loaded = False        # set True after lazy load succeeds
-        self._pred_running = False        # flag for the prediction loop
+        self._model_ready = threading.Event()   # set when a prewarm load finished (ok or not)
+        self._load_thread: Optional[threading.Thread] = None
+        self._load_error: Optional[Exception] = None
+        # Stop signal for the prediction loop; a fresh Event per session, so a thread
+        # that outlived its join can never resume when the next session starts
+        self._stop_ev = threading.Event()
+        self._stop_ev.set()
+        self._pred_join_timeout = pred_join_timeout
+        self.pred_batch = pred_batch
+        self.on_restart = on_restart
+        self.reset_audio = reset_audio
         self._pred_thread: Optional[threading.Thread] = None
+        self._last_cls_idx = -1           # class currently on the LEDs (-1: none drawn)
+        self._border_idx = ui.color_idx("WHITE")   # prediction border, resolved once
+        # Wakes the prediction loop when fresh audio is available (and on stop)
+        self._pred_wake = input_ready if input_ready is not None else threading.Event()
+
+        # Optional prediction process (see _predict_worker); the thread above then only draws
+        self.predict_in_process = predict_in_process
+        self._pred_proc = None
+        self._pred_stop = None
 
         # Last error text for debugging/diagnostics
         self._last_error: Optional[str] = None
 
+        # Sense HAT joystick direction → handler (one dict lookup per press)
+        self.joystick = {
+            "middle": self.on_middle,
+            "up": self.on_up,
+            "down": self.on_down,
+            "left": self.on_left,
+            "right": self.on_right,
+        }
+
+        # State → how to stop what that state runs (states not listed run nothing)
+        self._stoppers = {
+            S.MONITORING: self.monitor.stop,
+            S.CONTINUOUS: self.segment_rec.stop,
+            S.PREDICT: self._join_predict,
+        }
+
     # Lifecycle helpers
 
-    def _stop_all(self):
-        """Safely stop any running activity/threads (monitor, segments, predict)."""
-        try:
-            if self.state == "monitoring":
-                self.monitor.stop()
-        except Exception:
-            pass
-        try:
-            if self.state == "continuous":
-                self.segment_rec.stop()
-        except Exception:
-            pass
+    def _stop_all(self) -> bool:
+        """
+        Safely stop the activity/threads of the current state (monitor, segments, predict).
+        Returns False if a thread did not exit in time (see _join_predict).
+        """
+        stop = self._stoppers.get(self.state)
         try:
-            if self.state == "predict":
-                self._pred_running = False
-                if self._pred_thread:
-                    self._pred_thread.join(timeout=1.0)
-                    self._pred_thread = None
-        except Exception:
-            pass
+            if stop and stop() is False:
+                log.warning(f"stop {self.state}: thread did not exit in time")
+                return False
+        except (OSError, RuntimeError) as e:
+            # Device/port teardown (serial.SerialException is an OSError) or thread
+            # errors; anything else is a bug and should surface
+            log.warning(f"stop {self.state} failed: {e}")
+        return True
+
+    def _join_predict(self) -> bool:
+        """
+        Signal the prediction loop (and process, if any) to stop and wait for it.
+        Returns False if the thread is still running after pred_join_timeout; it then
+        stays in _pred_thread, so no second loop starts on the same interpreter.
+        """
+        self._stop_ev.set()
+        self._pred_wake.set()   # don't let the loop sit out its wait timeout
+        self._stop_predict_process()
+        t = self._pred_thread
+        if t is not None and t is not threading.current_thread():
+            t.join(timeout=self._pred_join_timeout)
+            if t.is_alive():
+                return False
+        self._pred_thread = None
+        return True
+
+    def _stop_predict_process(self):
+        """Ask the prediction process to exit; terminate it if it doesn't."""
+        if self._pred_stop is not None:
+            self._pred_stop.set()
+        if self._pred_proc is not None:
+            self._pred_proc.join(timeout=1.0)
+            if self._pred_proc.is_alive():
+                self._pred_proc.terminate()
+                self._pred_proc.join(timeout=1.0)
+            self._pred_proc = None
+        self._pred_stop = None
 
     def to_idle(self):
         """Stop everything and set LEDs to GREEN to indicate 'ready/idle'."""
         self._stop_all()
-        self.state = "idle"
+        self.state = S.IDLE
+        self._last_cls_idx = -1
         self.ui.fill("GREEN")
 
     # Error handling
@@ -84,20 +191,55 @@ class Controller:
         """Central error handler → stop all, set LEDs RED, enter 'error' state."""
         try:
             self._last_error = str(err)
-            print(f"[ERR] {self._last_error}")
+            log.error(self._last_error)
         finally:
-            self._stop_all()
-            self.state = "error"
-            self.ui.fill("RED")
+            try:
+                self._stop_all()
+            finally:
+                # Even if stopping hit an unexpected error, end up in the error state
+                self.state = S.ERROR
+                self._last_cls_idx = -1
+                self.ui.fill("RED")
+
+    def soft_reset(self):
+        """
+        In-process recovery: stop everything, reopen the audio reader and go idle.
+        Keeps the interpreter, imports and loaded model, unlike restart().
+        """
+        log.info("soft reset…")
+        self._stop_all()
+        # A predict loop stuck in inference would run next to the next one: restart instead
+        if not self._join_predict():
+            raise RuntimeError("predict thread did not exit")
+        if self.reset_audio:
+            self.reset_audio()
+        self._last_error = None
+        # Forget a failed model load (not one still in progress): the next DOWN retries it
+        if not self._model_loaded and self._model_ready.is_set():
+            self._load_thread = None
+            self._load_error = None
+            self._model_ready.clear()
+        self.to_idle()
+
+    def recover(self):
+        """From the error state: try a soft reset first, restart the process if that fails."""
+        try:
+            self.soft_reset()
+        except Exception as e:
+            log.error(f"soft reset failed: {e}")
+            self.restart()
 
     def restart(self):
         """Hard restart of the current Python process (execv)."""
-        print("[ctl] restarting process…")
+        log.info("restarting process…")
+        # Drain queued log records, then flush streams so nothing is lost on restart
+        if self.on_restart:
+            self.on_restart()
         try:
-            # Flush streams so logs are not lost on restart
             sys.stdout.flush()
             sys.stderr.flush()
-        except Exception:
+        except (OSError, ValueError):
+            # Broken pipe / closed stream: nothing left to save
             pass
         # Replace current process with a fresh interpreter running this script
         os.execv(sys.executable, [sys.executable] + sys.argv)
@@ -105,56 +247,56 @@ class Controller:
     # Joystick handlers
 
     def on_middle(self):
-        """Middle press: from error → restart; otherwise go to idle."""
-        if self.state == "error":
-            self.restart()
+        """Middle press: from error → recover (soft reset, else restart); otherwise go to idle."""
+        if self.state is S.ERROR:
+            self.recover()
             return
-        print("[ctl] -> idle")
+        log.info("-> idle")
         self.to_idle()
 
     def on_up(self):
         """Up press: record a fixed number of seconds once, then return to idle."""
-        if self.state == "error":
-            self.restart()
+        if self.state is S.ERROR:
+            self.recover()
             return
-        if self.state != "idle":
+        if self.state is not S.IDLE:
             return
 
-        print("[ctl] record start")
-        self.state = "recording"
+        log.info("record start")
+        self.state = S.RECORDING
         self.ui.fill("YELLOW")
         try:
             # Perform a blocking recording; returns path or None
             path = self.recorder.record_seconds(self.seconds)
             # Show GREEN if saved, RED if failed/empty; then return to idle
             self.ui.fill("GREEN" if path else "RED")
-            self.state = "idle"
+            self.state = S.IDLE
         except Exception as e:
             self.raise_error(e)
 
     def on_left(self):
         """Left press: toggle live monitoring on/off."""
-        if self.state == "error":
-            self.restart()
+        if self.state is S.ERROR:
+            self.recover()
             return
 
         # If already monitoring → stop it
-        if self.state == "monitoring":
-            print("[ctl] stop monitor")
+        if self.state is S.MONITORING:
+            log.info("stop monitor")
             try:
                 self.monitor.stop()
                 self.ui.fill("GREEN")
-                self.state = "idle"
+                self.state = S.IDLE
             except Exception as e:
                 self.raise_error(e)
             return
 
         # Only start if currently idle
-        if self.state != "idle":
+        if self.state is not S.IDLE:
             return
 
-        print("[ctl] start monitor")
-        self.state = "monitoring"
+        log.info("start monitor")
+        self.state = S.MONITORING
         self.ui.fill("CYAN")
         try:
             # Non-blocking start; Monitor manages its own threads/stream
@@ -164,27 +306,27 @@ class Controller:
 
     def on_right(self):
         """Right press: toggle continuous segment recording on/off."""
-        if self.state == "error":
-            self.restart()
+        if self.state is S.ERROR:
+            self.recover()
             return
 
         # If already recording segments → stop it
-        if self.state == "continuous":
-            print("[ctl] stop continuous record")
+        if self.state is S.CONTINUOUS:
+            log.info("stop continuous record")
             try:
                 self.segment_rec.stop()
                 self.ui.fill("GREEN")
-                self.state = "idle"
+                self.state = S.IDLE
             except Exception as e:
                 self.raise_error(e)
             return
 
         # Only start if idle
-        if self.state != "idle":
+        if self.state is not S.IDLE:
             return
 
-        print("[ctl] start continuous record")
-        self.state = "continuous"
+        log.info("start continuous record")
+        self.state = S.CONTINUOUS
         self.ui.fill("ORANGE")
         try:
             # Starts a background thread that slices and saves segments
@@ -194,56 +336,83 @@ class Controller:
 
     def on_down(self):
         """Down press: toggle prediction loop (load model on first use)."""
-        if self.state == "error":
-            self.restart()
+        if self.state is S.ERROR:
+            self.recover()
             return
 
         # If prediction is running → stop it
-        if self.state == "predict":
-            print("[ctl] stop predict")
+        if self.state is S.PREDICT:
+            log.info("stop predict")
             try:
-                self._pred_running = False
-                if self._pred_thread:
-                    self._pred_thread.join(timeout=1.0)
-                    self._pred_thread = None
-                self.state = "idle"
+                if not self._join_predict():
+                    # Inference is stuck; it stops at its next check, but say so
+                    self.raise_error(RuntimeError("predict thread did not exit"))
+                    return
+                self.state = S.IDLE
                 self.ui.fill("GREEN")
             except Exception as e:
                 self.raise_error(e)
             return
 
         # Only start prediction from idle
-        if self.state != "idle":
+        if self.state is not S.IDLE:
+            return
+
+        # A previous loop that never exited still owns the interpreter
+        if self._pred_thread is not None:
+            self.raise_error(RuntimeError("previous predict thread is still running"))
             return
 
-        # Lazy load the model/bundle (only the first time)
+        if self.predict_in_process:
+            self._start_predict_process()
+            return
+
+        # Model not loaded yet: wait for the prewarm, or load right here without one
         if not self._model_loaded:
-            try:
-                print("[ctl] loading model bundle…")
-                self._predictor, self._get_input_fn = self.load_model_bundle_fn()
-                self._model_loaded = True
-                print("[ctl] model bundle loaded")
-            except Exception as e:
+            if self._load_thread is None:
+                self._load_model()
+            elif not self._model_ready.is_set():
+                self.ui.fill("BLUE")
+                self._model_ready.wait()
+            if not self._model_loaded:
                 # Hard fail as discussed: set RED and enter error state
-                self.raise_error(e)
+                self.raise_error(self._load_error)
                 return
 
-        print("[ctl] start predict")
-        self.state = "predict"
-        self._pred_running = True
+        log.info("start predict")
+        self.state = S.PREDICT
+        stop_ev = self._stop_ev = threading.Event()
+        self._last_cls_idx = -1   # the LEDs show the idle color, so the first result always draws
 
         def loop():
-            # Background loop: fetch input → predict → draw LEDs
-            while self._pred_running:
+            # Background loop: fetch input → predict → draw LEDs.
+            # Everything the loop touches is bound to locals once (LOAD_FAST, no self.* lookups)
+            # The bundle's input fn takes out=..., so it can fill the interpreter's tensor directly;
+            # only the class is drawn, so the class-only calls skip the softmax entirely
+            predict = self._predictor.predict_class_inplace
+            predict_many = self._predictor.predict_classes_many
+            get_input = self._get_input_fn
+            batch = self.pred_batch
+            draw = self._draw_class   # shared with the process path: one change gate
+            stopped = stop_ev.is_set
+            wake = self._pred_wake
+            while not stopped():
                 try:
-                    cls_idx, probs = self._predictor.predict_one(self._get_input_fn)
-                    # Draw predicted class with a colored fill/border
-                    self.ui.draw_pred_class(cls_idx, self._palette, border_name="WHITE")
+                    if batch > 1:
+                        # One invoke() for several windows; show the newest result
+                        cls_idx = predict_many(get_input, batch)[-1]
+                    else:
+                        cls_idx = predict(get_input)
+                    if stopped():
+                        break   # stopped during inference: don't paint over the idle LEDs
+                    # Draw predicted class with a colored fill/border, only when it changed
+                    draw(cls_idx)
                 except Exception as e:
                     self.raise_error(e)
                     return
-                # Small sleep to keep CPU usage reasonable; tune for your pipeline
-                time.sleep(0.01)
+                # Park until the reader delivers new audio (timeout as a safety net)
+                wake.wait(timeout=0.1)
+                wake.clear()
 
         try:
             # Start prediction loop in a daemon thread
@@ -251,3 +420,79 @@ class Controller:
             self._pred_thread.start()
         except Exception as e:
             self.raise_error(e)
+
+    def _draw_class(self, cls_idx: int):
+        """Draw predicted class with a colored fill/border, only when it changed."""
+        if cls_idx != self._last_cls_idx:
+            self.ui.draw_pred_class(cls_idx, self._palette, border_idx=self._border_idx)
+            self._last_cls_idx = cls_idx
+
+    def _load_model(self):
+        """Load the model bundle once; on failure keep the error for on_down()."""
+        try:
+            log.info("loading model bundle…")
+            self._predictor, self._get_input_fn = self.load_model_bundle_fn()
+            self._model_loaded = True
+            log.info("model bundle loaded")
+        except Exception as e:
+            self._load_error = e
+            log.error(f"model bundle failed to load: {e}")
+        finally:
+            self._model_ready.set()
+
+    def prewarm_model(self):
+        """
+        Load the model bundle in the background right after startup, so the first
+        DOWN press doesn't stall on interpreter construction. No-op when prediction
+        runs in a child process (the child loads its own copy).
+        """
+        if self.predict_in_process or self._model_loaded or self._load_thread is not None:
+            return
+        self._load_thread = threading.Thread(target=self._load_model, daemon=True)
+        self._load_thread.start()
+
+    def _start_predict_process(self):
+        """
+        Prediction in a child process: the child loads the bundle and runs
+        inference; this process only drains results and draws the LEDs.
+        Uses 'fork' so load_model_bundle_fn (a closure) needs no pickling; the
+        child reads audio through the bundle's reader_factory (the shared AudioRing).
+        """
+        log.info("start predict (process)")
+        self.state = S.PREDICT
+        stop_ev = self._stop_ev = threading.Event()
+        self._last_cls_idx = -1   # the LEDs show the idle color, so the first result always draws
+
+        ctx = mp.get_context("fork")
+        out_q = ctx.Queue(maxsize=4)
+        self._pred_stop = ctx.Event()
+        proc = ctx.Process(
+            target=_predict_worker,
+            args=(self.load_model_bundle_fn, out_q, self._pred_stop),
+            daemon=True
+        )
+
+        def drain():
+            # Background loop: receive results → draw LEDs
+            while not stop_ev.is_set():
+                try:
+                    kind, a, b = out_q.get(timeout=0.1)
+                except queue.Empty:
+                    if not proc.is_alive() and not stop_ev.is_set():
+                        self.raise_error(RuntimeError(f"predict process exited (code {proc.exitcode})"))
+                        return
+                    continue
+                if kind == "error":
+                    self.raise_error(RuntimeError(a))
+                    return
+                if stop_ev.is_set():
+                    break
+                self._draw_class(a)
+
+        try:
+            proc.start()
+            self._pred_proc = proc
+            self._pred_thread = threading.Thread(target=drain, daemon=True)
+            self._pred_thread.start()
+        except Exception as e:
+            self.raise_error(e)
@@ -0,0 +1,135 @@
+import time
+import multiprocessing as mp
+from multiprocessing import shared_memory
+import numpy as np
+from typing import Callable, Optional
+from .ring import SpscRing
+
+
+def _reader_proc(reader_factory, shm, capacity: int, lock, stop_ev):
+    """
+    Child process body: open the real reader and copy everything it returns into
+    the shared-memory ring. Runs under its own GIL, so serial I/O and the per-chunk
+    Python work never stall threads in the audio process.
+    """
+    ring = SpscRing(capacity, buffer=shm.buf, lock=lock)
+    with reader_factory() as reader:
+        read_into = getattr(reader, "read_into", None)
+        while not stop_ev.is_set():
+            span = ring.write_span()
+            if read_into is not None and span.size:
+                # Read straight into shared memory, then publish
+                ring.commit(read_into(span))
+                continue
+            raw = reader.read_bytes()
+            if raw:
+                ring.write(raw)  # drops what doesn't fit if the consumer falls behind
+
+
+class ProcessReader:
+    """
+    Drop-in reader (context manager with read_bytes()/read_into()) that runs another reader
+    in a child process and hands its bytes over through shared memory.
+
+    - reader_factory: the real reader factory (e.g. SerialAudioReader), opened in the child
+    - capacity_bytes: size of the shared ring; ~1 s of audio is plenty
+    - chunk_bytes: maximum size returned by one read_bytes() call
+    - on_data: optional callback run in this (parent) process after each read that
+      returned data; a callback given to the child's reader would fire in the child
+
+    Uses the 'fork' start method so reader_factory (often a lambda) needs no pickling;
+    the child inherits the shared-memory mapping directly.
+    """
+    def __init__(self, reader_factory, capacity_bytes: int, chunk_bytes: int,
+                 timeout: float = 0.2, poll: float = 0.005,
+                 on_data: Optional[Callable[[], None]] = None):
+        self.reader_factory = reader_factory
+        self.on_data = on_data
+        self.capacity = capacity_bytes
+        self.timeout = timeout        # read_bytes() returns b"" after this long without data
+        self.poll = poll              # sleep between checks while the ring is empty
+        self._out = np.empty(chunk_bytes, dtype=np.uint8)
+
+        self._shm = None
+        self._ring = None
+        self._proc = None
+        self._stop = None
+
+    def __enter__(self):
+        ctx = mp.get_context("fork")
+        self._shm = shared_memory.SharedMemory(create=True, size=SpscRing.nbytes(self.capacity))
+        self._shm.buf[:SpscRing.HEADER_BYTES] = bytes(SpscRing.HEADER_BYTES)  # zero the counters
+        # One lock for both processes: it orders the ring counters after the data
+        lock = ctx.Lock()
+        self._ring = SpscRing(self.capacity, buffer=self._shm.buf, lock=lock)
+        self._stop = ctx.Event()
+        self._proc = ctx.Process(
+            target=_reader_proc,
+            args=(self.reader_factory, self._shm, self.capacity, lock, self._stop),
+            daemon=True
+        )
+        self._proc.start()
+        return self
+
+    def __exit__(self, *exc):
+        # Ask the child to stop, then make sure it is gone
+        if self._stop is not None:
+            self._stop.set()
+        if self._proc is not None:
+            self._proc.join(timeout=1.0)
+            if self._proc.is_alive():
+                self._proc.terminate()
+                self._proc.join(timeout=1.0)
+            self._proc = None
+
+        # Numpy views must be dropped before the mapping can be closed
+        self._ring = None
+        if self._shm is not None:
+            try:
+                try:
+                    self._shm.close()
+                finally:
+                    # Always remove the segment, even if close() failed (e.g. BufferError
+                    # from a view still alive), or /dev/shm leaks one per restart
+                    self._shm.unlink()
+            except Exception:
+                # Ignore teardown errors during close
+                pass
+            self._shm = None
+
+    def read_bytes(self) -> bytes:
+        """
+        Return the bytes the child produced since the last call (up to chunk_bytes),
+        waiting at most `timeout` seconds. Raises if the child process died.
+        """
+        deadline = time.monotonic() + self.timeout
+        while True:
+            n = self._ring.read_into(self._out, partial=True)
+            if n:
+                if self.on_data:
+                    self.on_data()
+                return self._out[:n].tobytes()
+            if not self._proc.is_alive():
+                raise RuntimeError(f"reader process exited (code {self._proc.exitcode})")
+            if time.monotonic() >= deadline:
+                return b""
+            time.sleep(self.poll)
+
+    def read_into(self, buf) -> int:
+        """
+        Like read_bytes(), but copy straight into a caller-provided writable buffer.
+        Returns the number of bytes stored (0 after `timeout` without data).
+        """
+        dst = np.frombuffer(memoryview(buf).cast("B"), dtype=np.uint8)
+        deadline = time.monotonic() + self.timeout
+        while True:
+            n = self._ring.read_into(dst, partial=True)
+            if n:
+                if self.on_data:
+                    self.on_data()
+                return n
+            if not self._proc.is_alive():
+                raise RuntimeError(f"reader process exited (code {self._proc.exitcode})")
+            if time.monotonic() >= deadline:
+                return 0
+            time.sleep(self.poll)
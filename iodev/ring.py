@@ -0,0 +1,356 @@
+import os
+import mmap
+import time
+import threading
+import multiprocessing as mp
+import numpy as np
+
+
+def next_pow2(n: int) -> int:
+    """Smallest power of two >= n (ring capacities must be powers of two)."""
+    return 1 << max(0, int(n) - 1).bit_length()
+
+
+class SpscRing:
+    """
+    Single-producer / single-consumer byte ring buffer with preallocated storage.
+
+    - No allocation on write/read: one thread writes, one thread reads.
+    - Capacity is rounded up to a power of two, so wrapping is a bit mask.
+    - Read and write counters live 64 bytes apart (separate cache lines) so the
+      producer and consumer don't invalidate each other's line on every update.
+    - Counters only ever increase; position in the buffer is counter & mask.
+
+    Ordering: the producer copies data first and publishes the new write counter
+    afterwards; the consumer reads the write counter before copying data out.
+    Counters are loaded and stored under `lock`, whose acquire/release is the
+    memory barrier that makes this hold on weakly ordered cores (ARM64) without
+    the GIL. It is held only around counter accesses, never during copies.
+
+    Pass `buffer` (e.g. SharedMemory.buf, at least nbytes(capacity) long) to place
+    counters and data in external memory, so producer and consumer can live in
+    different processes. The buffer must start zeroed, and both sides must then
+    pass the same multiprocessing.Lock.
+    """
+    HEADER_BYTES = 128   # two 64-byte cache lines holding the counters
+    _W = 0   # index of the write counter in self._idx
+    _R = 8   # index of the read counter (8 * 8 bytes = one 64-byte cache line away)
+
+    def __init__(self, capacity: int, buffer=None, lock=None):
+        cap = next_pow2(capacity)
+        self.capacity = cap
+        self._mask = cap - 1
+        if buffer is not None and lock is None:
+            raise ValueError("a ring in external memory needs a shared lock (multiprocessing.Lock)")
+        self._lock = lock if lock is not None else threading.Lock()
+        if buffer is None:
+            self._buf = np.zeros(cap, dtype=np.uint8)   # backing storage, allocated once
+            self._idx = np.zeros(16, dtype=np.uint64)   # [write, pad..., read, pad...]
+        else:
+            mem = np.frombuffer(buffer, dtype=np.uint8, count=self.nbytes(cap))
+            self._idx = mem[:self.HEADER_BYTES].view(np.uint64)
+            self._buf = mem[self.HEADER_BYTES:]
+
+    @classmethod
+    def nbytes(cls, capacity: int) -> int:
+        """Size of the external buffer needed for a ring of `capacity` bytes."""
+        return cls.HEADER_BYTES + next_pow2(capacity)
+
+    def _counters(self) -> tuple[int, int]:
+        # (write, read), loaded under the lock (acquire: see data published before them)
+        with self._lock:
+            return int(self._idx[self._W]), int(self._idx[self._R])
+
+    def _publish(self, i: int, value: int):
+        # Store a counter under the lock (release: data written before it is visible first)
+        with self._lock:
+            self._idx[i] = value
+
+    def readable(self) -> int:
+        """Number of bytes available to the consumer."""
+        w, r = self._counters()
+        return w - r
+
+    def writable(self) -> int:
+        """Number of bytes the producer can write without overrunning the consumer."""
+        return self.capacity - self.readable()
+
+    def write(self, data) -> int:
+        """
+        Producer side: copy as much of `data` as fits into the ring.
+        Returns the number of bytes written (extra bytes are dropped when full).
+        """
+        src = np.frombuffer(data, dtype=np.uint8)
+        w, r = self._counters()
+        n = min(src.size, self.capacity - (w - r))
+        if n <= 0:
+            return 0
+
+        # Copy in at most two slices (before and after the wrap point)
+        pos = w & self._mask
+        first = min(n, self.capacity - pos)
+        self._buf[pos:pos + first] = src[:first]
+        if n > first:
+            self._buf[:n - first] = src[first:n]
+
+        # Publish only after the data is in place
+        self._publish(self._W, w + n)
+        return n
+
+    def write_span(self) -> np.ndarray:
+        """
+        Producer side, zero-copy: the contiguous free region at the write position
+        (up to the wrap point). Fill it in place (e.g. reader.read_into(span)) and
+        then publish the bytes with commit(n). Empty when the ring is full.
+        """
+        w, r = self._counters()
+        pos = w & self._mask
+        free = self.capacity - (w - r)
+        return self._buf[pos:pos + min(free, self.capacity - pos)]
+
+    def commit(self, n: int):
+        """Producer side: publish `n` bytes written into the last write_span()."""
+        # Only the producer stores the write counter, so reading it back needs no lock
+        self._publish(self._W, int(self._idx[self._W]) + n)
+
+    def read_into(self, dst: np.ndarray, partial: bool = False) -> int:
+        """
+        Consumer side: fill `dst` (a uint8 array, e.g. an int16 block viewed as
+        bytes) completely from the ring. No shifting and no allocation: at most
+        two slice copies around the wrap point.
+        Returns the number of bytes copied, or 0 if not enough data is available.
+        With partial=True, copy whatever is available (up to dst.size) instead.
+        """
+        w, r = self._counters()
+        avail = w - r
+        n = min(dst.size, avail) if partial else dst.size
+        if n <= 0 or avail < n:
+            return 0
+
+        pos = r & self._mask
+        first = min(n, self.capacity - pos)
+        np.copyto(dst[:first], self._buf[pos:pos + first])
+        if n > first:
+            np.copyto(dst[first:n], self._buf[:n - first])
+
+        # Release the space only after the data was copied out
+        self._publish(self._R, r + n)
+        return n
+
+    def clear(self):
+        """Drop all buffered data (only call when producer and consumer are stopped)."""
+        with self._lock:
+            self._idx[:] = 0
+
+
+class AudioRing:
+    """
+    One serial reader, many consumers: a producer thread reads int16 audio straight
+    into a fixed ring (power-of-two samples), and each consumer follows it with its
+    own cursor. Memory stays bounded no matter how long a session runs.
+
+    - reader(): reader_factory-compatible context manager with read_bytes() and
+      read_into(), so Recorder, SegmentRecorder, Monitor and bundle preprocessors
+      take `ring.reader` wherever they took a reader factory.
+    - The producer opens the real reader when the first consumer enters and closes
+      it when the last one leaves, unless start() pinned it open until close().
+    - The ring lives in an anonymous shared mapping, so a forked child (e.g. the
+      prediction process) can follow a pinned producer in the parent; such
+      readers poll the shared sample counter instead of waiting on the Condition.
+      That counter is stored and loaded under a multiprocessing.Lock, which orders
+      it after the samples across processes (and cores).
+    - A consumer that falls more than one ring behind skips ahead (oldest audio is
+      lost, counted in its `dropped`); the producer never waits for consumers.
+    - Odd-length reads need no carry: bytes land in place and only whole samples
+      are published.
+    """
+    def __init__(self, reader_factory, n_samples: int, chunk_bytes: int, timeout: float = 0.2):
+        self.reader_factory = reader_factory
+        self.size = next_pow2(max(n_samples, chunk_bytes))
+        self._mask = self.size - 1
+        # Anonymous MAP_SHARED memory (zero-filled): 64-byte header, then the ring itself
+        self._mem = mmap.mmap(-1, 64 + self.size * 2)
+        self._hdr = np.frombuffer(self._mem, dtype=np.uint64, count=1)   # published samples, for forked readers
+        self._hdr_lock = mp.Lock()  # shared with forked children: orders _hdr after the samples
+        self.buf = np.frombuffer(self._mem, dtype=np.int16, offset=64)   # the ring, allocated once
+        self._bytes = self.buf.view(np.uint8)            # same memory; the reader fills this
+        self.chunk = chunk_bytes
+        self.timeout = timeout      # consumers' read returns empty after this long without data
+
+        # The producer may be writing up to one chunk past the published counter, so
+        # consumers only ever copy out of the `_depth` samples behind it
+        self._depth = self.size - (chunk_bytes // 2 + 1)
+
+        self._wb = 0                # bytes written so far (monotonic; may end mid-sample)
+        self._w = 0                 # whole samples published to consumers
+        self._cond = threading.Condition()
+        self._users = 0             # open consumers
+        self._t = None              # producer thread
+        self._stop = threading.Event()  # stop signal of the current producer (new one per producer)
+        self._error = None          # exception that ended the producer, re-raised to consumers
+        self._pinned = False        # start() keeps the producer running without consumers
+        self._pid = os.getpid()     # process that owns the producer thread
+
+    # Producer thread: read from the real reader straight into the ring memory
+    def _produce(self, stop: threading.Event):
+        cap = self._bytes.size
+        try:
+            with self.reader_factory() as reader:
+                while not stop.is_set():
+                    pos = self._wb & (cap - 1)
+                    got = reader.read_into(self._bytes[pos:min(cap, pos + self.chunk)])
+                    if got:
+                        with self._cond:
+                            self._wb += got
+                            self._w = self._wb // 2
+                            with self._hdr_lock:
+                                self._hdr[0] = self._w
+                            self._cond.notify_all()
+        except Exception as e:
+            with self._cond:
+                self._error = e
+                self._cond.notify_all()
+
+    def _forked(self) -> bool:
+        # True in a forked child following a producer that runs in the parent
+        return self._pinned and os.getpid() != self._pid
+
+    def _attach(self) -> int:
+        if self._forked():
+            return self._shared_w()
+        with self._cond:
+            self._users += 1
+            if self._t is None or not self._t.is_alive():
+                self._start_producer()
+            return self._w
+
+    def _start_producer(self):
+        # Caller holds self._cond. Fresh session: drop a dangling half sample and any old error
+        self._wb = self._w * 2
+        self._error = None
+        self._stop = threading.Event()
+        self._t = threading.Thread(target=self._produce, args=(self._stop,), daemon=True)
+        self._t.start()
+
+    def _detach(self):
+        if self._forked():
+            return
+        with self._cond:
+            self._users -= 1
+            if self._users:
+                return
+            self._stop.set()
+            t, self._t = self._t, None
+        if t is not None:
+            t.join(timeout=1.0)
+
+    def start(self):
+        """
+        Open the real reader now and keep it open until close(), so switching modes
+        never reopens the port. Call from the process that should own the reader.
+        """
+        if self._pinned:
+            return
+        self._pid = os.getpid()
+        self._attach()              # the pin counts as one permanent consumer
+        self._pinned = True
+
+    def reset(self):
+        """
+        Close and reopen the real reader (e.g. after a serial error), keeping the
+        ring and every consumer's cursor. No-op in a forked child.
+        """
+        if self._forked():
+            return
+        with self._cond:
+            self._stop.set()
+            t, self._t = self._t, None
+        if t is not None:
+            t.join(timeout=1.0)
+        with self._cond:
+            if self._users and self._t is None:
+                self._start_producer()
+
+    def close(self):
+        """Release the start() pin; the reader closes once no consumer is left."""
+        if not self._pinned or os.getpid() != self._pid:
+            return
+        self._pinned = False
+        self._detach()
+
+    def _shared_w(self) -> int:
+        # Published sample count, loaded under the shared lock (see _produce)
+        with self._hdr_lock:
+            return int(self._hdr[0])
+
+    def _wait_shared(self, r: int) -> int:
+        # Forked reader: the Condition lives in the parent, so poll the shared counter
+        deadline = time.monotonic() + self.timeout
+        w = self._shared_w()
+        while w == r and time.monotonic() < deadline:
+            time.sleep(0.005)
+            w = self._shared_w()
+        return w
+
+    def reader(self) -> "_RingReader":
+        """New consumer cursor, starting at the live edge (pass `ring.reader` as a factory)."""
+        return _RingReader(self)
+
+
+class _RingReader:
+    """Consumer cursor over an AudioRing; see AudioRing.reader()."""
+    def __init__(self, ring: AudioRing):
+        self._ring = ring
+        self._r = 0                 # samples consumed (monotonic, like the ring's counter)
+        self.dropped = 0            # samples skipped because this consumer fell behind
+        self._out = np.empty(ring.chunk // 2 * 2, dtype=np.uint8)   # read_bytes() scratch
+
+    def __enter__(self):
+        self._r = self._ring._attach()
+        return self
+
+    def __exit__(self, *exc):
+        self._ring._detach()
+
+    def read_into(self, buf) -> int:
+        """
+        Copy the samples published since the last call into `buf` (whole samples
+        only, up to its size), waiting at most `timeout` for new ones.
+        Returns the number of bytes stored.
+        """
+        ring = self._ring
+        dst = np.frombuffer(memoryview(buf).cast("B"), dtype=np.uint8)
+        if ring._forked():
+            w = ring._wait_shared(self._r)
+        else:
+            with ring._cond:
+                if ring._w == self._r and ring._error is None:
+                    ring._cond.wait(ring.timeout)
+                if ring._error is not None:
+                    raise ring._error
+                w = ring._w
+
+        # Too far behind: skip to the oldest samples that are still intact
+        lag = w - self._r
+        if lag > ring._depth:
+            self.dropped += lag - ring._depth
+            self._r = w - ring._depth
+
+        n = min(w - self._r, dst.size // 2)
+        if n <= 0:
+            return 0
+
+        # Copy out in at most two slices (before and after the wrap point)
+        pos = self._r & ring._mask
+        first = min(n, ring.size - pos)
+        src = ring._bytes
+        dst[:first * 2] = src[pos * 2:(pos + first) * 2]
+        if n > first:
+            dst[first * 2:n * 2] = src[:(n - first) * 2]
+        self._r += n
+        return n * 2
+
+    def read_bytes(self) -> bytes:
+        """Like read_into(), but return up to one chunk as a new bytes object."""
+        n = self.read_into(self._out)
+        return self._out[:n].tobytes()
@@ -1,5 +1,6 @@
 import time
 import serial
+from typing import Callable, Optional
 
 class SerialAudioReader:
     """
@@ -8,12 +9,18 @@ class SerialAudioReader:
     - Opens the port exclusively (on Linux) to prevent double access.
     - Automatically reopens on transient errors like:
       "device reports readiness to read but returned no data".
+    - read_bytes() waits inside pyserial's select()/os.read() calls, which
+      release the GIL, so audio threads keep running while we block on the port.
+    - on_data (optional) is called after every read that returned data, e.g. to
+      wake a consumer waiting on a threading.Event.
     """
-    def __init__(self, port: str, baud: int, chunk_bytes: int):
+    def __init__(self, port: str, baud: int, chunk_bytes: int,
+                 on_data: Optional[Callable[[], None]] = None):
         # Store connection parameters and the per-read byte size
         self.port = port
         self.baud = baud
         self.chunk = chunk_bytes
+        self.on_data = on_data
         self.ser: serial.Serial | None = None
 
     def __enter__(self):
@@ -58,6 +65,30 @@ class SerialAudioReader:
         time.sleep(0.1)
         self._open()
 
+    def _recover(self, e: serial.SerialException) -> bool:
+        """
+        Try to recover from a transient SerialException by reopening the port.
+        Returns True if the error was transient (caller should return "no data"),
+        False if it should be raised.
+        """
+        # Known pyserial case:
+        # "device reports readiness to read but returned no data
+        #  (device disconnected or multiple access on port?)"
+        msg = str(e).lower()
+        if (
+            "readiness to read" in msg
+            or "multiple access" in msg
+            or "returned no data" in msg
+        ):
+            # Attempt a clean recovery; if it fails, we still return empty bytes
+            try:
+                self._reopen()
+            except Exception:
+                # If reopen fails, let the caller keep looping until time runs out
+                pass
+            return True
+        return False
+
     # Public API
 
     def read_bytes(self) -> bytes:
@@ -74,25 +105,37 @@ class SerialAudioReader:
 
         try:
             # Read exactly up to self.chunk bytes (may return fewer)
-            return self.ser.read(self.chunk)
+            data = self.ser.read(self.chunk)
+            if data and self.on_data:
+                self.on_data()
+            return data
 
         except serial.SerialException as e:
-            # Known pyserial case:
-            # "device reports readiness to read but returned no data
-            #  (device disconnected or multiple access on port?)"
-            msg = str(e).lower()
-            if (
-                "readiness to read" in msg
-                or "multiple access" in msg
-                or "returned no data" in msg
-            ):
-                # Attempt a clean recovery; if it fails, we still return empty bytes
-                try:
-                    self._reopen()
-                except Exception:
-                    # If reopen fails, let the caller keep looping until time runs out
-                    pass
+            if self._recover(e):
                 return b""
+            # For other serial errors, bubble the exception up
+            raise
 
+    def read_into(self, buf) -> int:
+        """
+        Like read_bytes(), but store the data in a caller-provided writable,
+        contiguous buffer (e.g. a numpy view into a ring) instead of returning a
+        new bytes object.
+        Reads at most `chunk` bytes; returns the number of bytes stored (0 on a
+        recovered transient error).
+        """
+        # Ensure the port is open before reading
+        if not self.ser:
+            self._open()
+
+        try:
+            n = self.ser.readinto(memoryview(buf).cast("B")[: self.chunk]) or 0
+            if n and self.on_data:
+                self.on_data()
+            return n
+
+        except serial.SerialException as e:
+            if self._recover(e):
+                return 0
             # For other serial errors, bubble the exception up
             raise
@@ -1,15 +1,65 @@
-from config.config import Config, COLORS, CLASS_COLORS
+from config.config import Config, COLORS, CLASS_COLORS, FREE_THREADED
 from ui.sense_ui import SenseUI, SenseHat
 from iodev.serial_stream import SerialAudioReader
+from iodev.process_reader import ProcessReader
+from iodev.ring import AudioRing
 from audio.recorder import Recorder
 from audio.segment_recorder import SegmentRecorder
 from audio.monitor import Monitor
 from models.manager import ModelBundleManager
 from control.controller import Controller
-import os, time
+import os, time, threading, atexit, signal, queue
+import logging, logging.handlers
+
+# Optional: pyudev lets us drop the cached output dir the moment a USB stick comes or goes
+try:
+    import pyudev
+except ImportError:
+    pyudev = None
+
+# Last resolved output directory and when it was resolved (monotonic seconds)
+_output_dir_cache = {"dir": None, "ts": 0.0}
+OUTPUT_DIR_TTL = 30.0   # re-scan the USB mounts at most this often
+
+
+def invalidate_output_dir():
+    """Forget the cached output directory (next get_output_dir() re-scans)."""
+    _output_dir_cache["dir"] = None
 
 
 def get_output_dir() -> str:
+    """
+    Determine where to save audio recordings (cached; see _scan_output_dir).
+    The cached answer is reused for OUTPUT_DIR_TTL seconds, as long as its USB
+    mount is still there.
+    """
+    d = _output_dir_cache["dir"]
+    if d is not None and time.monotonic() - _output_dir_cache["ts"] < OUTPUT_DIR_TTL:
+        # Local 'data' is always valid; a USB path only while it's still mounted
+        if d == "data" or os.path.ismount(os.path.dirname(d)):
+            return d
+    d = _scan_output_dir()
+    _output_dir_cache["dir"], _output_dir_cache["ts"] = d, time.monotonic()
+    return d
+
+
+def watch_usb_mounts():
+    """Invalidate the output dir cache on USB block-device hot-plug (needs pyudev)."""
+    if pyudev is None:
+        return None
+    try:
+        monitor = pyudev.Monitor.from_netlink(pyudev.Context())
+        monitor.filter_by(subsystem="block")
+        observer = pyudev.MonitorObserver(monitor, callback=lambda device: invalidate_output_dir())
+        observer.daemon = True
+        observer.start()
+        return observer
+    except Exception as e:
+        print(f"[main] USB hot-plug watch unavailable: {e}")
+        return None
+
+
+def _scan_output_dir() -> str:
     """
     Determine where to save audio recordings.
     - If a USB drive is mounted under /media/LongPi, use its 'data' folder.
@@ -27,21 +77,57 @@ def get_output_dir() -> str:
     return os.path.join(usb_base, mounts[0], 'data') if mounts else "data"
 
 
-def build_controller() -> Controller:
+def setup_logging() -> logging.handlers.QueueListener:
+    """
+    Route logging through an unbounded queue: callers only enqueue a record, and
+    a listener thread does the (possibly slow) terminal/file write.
+    """
+    q = queue.Queue(-1)
+    root = logging.getLogger()
+    root.setLevel(logging.INFO)
+    root.addHandler(logging.handlers.QueueHandler(q))
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter("[%(name)s] %(message)s"))
+    listener = logging.handlers.QueueListener(q, handler)
+    listener.start()
+    return listener
+
+
+def build_controller(on_restart=None) -> Controller:
     """
     Build and connect all core components:
       - Config: global settings
       - SenseUI: LED matrix interface
       - SerialAudioReader: reads audio bytes from microcontroller
+      - AudioRing: one reader feeding a bounded ring that all consumers follow
       - Recorder / SegmentRecorder / Monitor: handle audio capture and playback
-      - ModelBundleManager: lazy-loaded model manager
+      - ModelBundleManager: model manager, loaded in the background after startup
       - Controller: connects joystick actions to all the above
     """
     cfg = Config()
     ui = SenseUI(COLORS)
 
+    # Set by the reader whenever a chunk arrives; wakes the prediction loop
+    input_ready = threading.Event()
+
     # Reader factory → creates a new SerialAudioReader each time it’s used
-    reader_factory = lambda: SerialAudioReader(cfg.COM_PORT, cfg.BAUD, cfg.READ_CHUNK_BYTES)
+    reader_factory = lambda: SerialAudioReader(
+        cfg.COM_PORT, cfg.BAUD, cfg.READ_CHUNK_BYTES, on_data=input_ready.set
+    )
+
+    # Optionally move the serial reader into a child process (~1 s shared-memory ring)
+    if cfg.READER_PROCESS:
+        serial_factory = lambda: SerialAudioReader(cfg.COM_PORT, cfg.BAUD, cfg.READ_CHUNK_BYTES)
+        reader_factory = lambda: ProcessReader(
+            serial_factory, cfg.FS * 2, cfg.READ_CHUNK_BYTES, on_data=input_ready.set
+        )
+
+    # One producer fills a ~2 s ring; every consumer reads it through its own cursor.
+    # The port is opened once here and stays open, so mode switches never reopen it.
+    ring = AudioRing(reader_factory, cfg.FS * 2, cfg.READ_CHUNK_BYTES)
+    ring.start()
+    atexit.register(ring.close)
+    reader_factory = ring.reader
 
     # Create the three audio workers
     rec = Recorder(
@@ -54,7 +140,8 @@ def build_controller() -> Controller:
         cfg.FS, reader_factory, get_output_dir,
         segment_seconds=cfg.SEGMENT_SECONDS,
         out_device=cfg.AUDIO_OUT_DEVICE,
-        blocksize=cfg.AUDIO_BLOCK_SAMPLES
+        blocksize=cfg.AUDIO_BLOCK_SAMPLES,
+        preallocate=cfg.WAV_PREALLOCATE
     )
 
     mon = Monitor(
@@ -62,13 +149,13 @@ def build_controller() -> Controller:
         out_device=cfg.AUDIO_OUT_DEVICE
     )
 
-    # Lazy model loader — only runs when prediction mode starts (DOWN press)
+    # Model loader — prewarmed in the background at startup (or run on the first DOWN press)
     def load_model_bundle_fn():
         mbm = ModelBundleManager(cfg, reader_factory)
         # This may raise FileNotFoundError etc. → Controller handles it and sets RED LED
         mbm.load_active_bundle()
         predictor = mbm.predictor
-        get_input_fn = mbm.get_input_fn()
+        get_input_fn = mbm.input_fn   # built once at load (one closure, one set of buffers)
         return predictor, get_input_fn
 
     # Create the main controller object, wiring together all modules
@@ -80,7 +167,12 @@ def build_controller() -> Controller:
         load_model_bundle_fn=load_model_bundle_fn,
         seconds=cfg.RECORD_SECONDS,
         segment_seconds=cfg.SEGMENT_SECONDS,
-        class_palette=CLASS_COLORS
+        class_palette=CLASS_COLORS,
+        input_ready=input_ready,
+        predict_in_process=cfg.PREDICT_PROCESS,
+        on_restart=on_restart,
+        pred_batch=cfg.PRED_BATCH,
+        reset_audio=ring.reset
     )
 
     # Connect error callbacks for audio components → report to controller
@@ -92,35 +184,53 @@ def build_controller() -> Controller:
 
 if __name__ == "__main__":
     # Build and start the system
-    ctl = build_controller()
+    if FREE_THREADED:
+        print("[main] free-threaded CPython: audio threads run without the GIL")
+    log_listener = setup_logging()
+    atexit.register(log_listener.stop)
+    ctl = build_controller(on_restart=log_listener.stop)
 
     def handle_event(event):
         """
         Handle Sense HAT joystick input.
         - Only respond to press events (not hold or release)
-        - Map directions to controller actions
+        - Map directions to controller actions (DOWN waits for the model if it is still loading)
         """
-        if getattr(event, "action", None) != "pressed":
+        try:
+            if event.action != "pressed":
+                return
+            handler = ctl.joystick.get(event.direction)
+        except AttributeError:
+            # Not a joystick event
             return
-        d = getattr(event, "direction", None)
-        if d == "middle":
-            ctl.on_middle()
-        elif d == "up":
-            ctl.on_up()
-        elif d == "down":
-            ctl.on_down()   # Model loading happens here (lazy)
-        elif d == "left":
-            ctl.on_left()
-        elif d == "right":
-            ctl.on_right()
+        if handler:
+            handler()
+
+    # Re-scan the output dir as soon as a USB stick is plugged in or pulled
+    watch_usb_mounts()
 
     # Register joystick event handler
     SenseHat().stick.direction_any = handle_event
 
     # Set LEDs to idle (green) and show ready message
     ctl.to_idle()
-    print("🟢 Idle — model loads only on DOWN (predict).")
-
-    # Keep the program running indefinitely
-    while True:
-        time.sleep(0.1)
+    print("🟢 Idle — model is loading in the background for DOWN (predict).")
+
+    # Load the model bundle while the user is still reaching for the joystick
+    ctl.prewarm_model()
+
+    # Park the main thread until SIGINT/SIGTERM (no periodic wakeups), then shut down cleanly
+    shutdown = threading.Event()
+    signal.signal(signal.SIGINT, lambda *_: shutdown.set())
+    signal.signal(signal.SIGTERM, lambda *_: shutdown.set())
+    if hasattr(signal, "pause"):
+        # POSIX: sleep in the kernel until a signal arrives (handlers run right after)
+        while not shutdown.is_set():
+            signal.pause()
+    else:
+        # Windows dev machines have no signal.pause()
+        shutdown.wait()
+
+    print("[main] shutting down")
+    ctl._stop_all()
+    ctl.ui.fill("OFF")
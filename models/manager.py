@@ -1,9 +1,74 @@
-import os, json, hashlib, importlib.util
+import os, json, copy, hashlib, mmap, inspect, importlib.util, sysconfig
+from types import ModuleType
 from typing import Callable, Optional
 import numpy as np
 from config.config import Config
 from predict.tflite_predictor import TFLitePredictor
 
+# Prefer msgspec's C JSON decoder for manifest/labels; fall back to the stdlib
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+# Optional: BLAKE3 hashes a model with all cores and SIMD (manifest "model_hash_algo": "blake3")
+try:
+    import blake3
+except ImportError:
+    blake3 = None
+
+# Optional: Cython compiles preprocess.py to a C extension (manifest "preprocess_cython": true)
+try:
+    from Cython.Build import cythonize
+except ImportError:
+    cythonize = None
+
+# Parsed JSON files and model checksums, keyed by (path, st_mtime_ns, st_size):
+# reloading an unchanged bundle skips the disk reads, JSON decoding and hashing
+_JSON_CACHE: dict[tuple[str, int, int], object] = {}
+_SHA_CACHE: dict[tuple[str, int, int], str] = {}
+
+# Files at least this big are hashed through a read-only mmap (one C-level update,
+# kernel readahead, and the page cache is warm when the interpreter loads the model)
+SHA_MMAP_MIN_BYTES = 1 << 20
+
+# Imported preprocess.py modules keyed by (path, st_mtime_ns, preprocess_cython): an
+# unchanged plugin is not recompiled/re-executed on bundle reload, and toggling the
+# manifest's Cython flag loads the other build instead of reusing the cached one
+_PP_MOD_CACHE: dict[tuple[str, int, bool], ModuleType] = {}
+
+
+def _cython_build(py_path: str, build_dir: str) -> str:
+    """
+    Compile a .py/.pyx module with Cython into build_dir and return the extension's path.
+    An extension newer than its source is reused without invoking the compiler.
+    """
+    name = os.path.splitext(os.path.basename(py_path))[0]   # must match the PyInit_<name> symbol
+    so_path = os.path.join(build_dir, name + sysconfig.get_config_var("EXT_SUFFIX"))
+    if os.path.exists(so_path) and os.stat(so_path).st_mtime_ns >= os.stat(py_path).st_mtime_ns:
+        return so_path
+
+    # setuptools is only needed (and imported) when something has to be built
+    from setuptools import Extension
+    from setuptools.dist import Distribution
+    from setuptools.command.build_ext import build_ext
+
+    ext = cythonize([Extension(name, [py_path])], language_level=3,
+                    build_dir=os.path.join(build_dir, "src"), quiet=True)
+    cmd = build_ext(Distribution({"ext_modules": ext}))
+    cmd.build_lib = build_dir
+    cmd.build_temp = os.path.join(build_dir, "tmp")
+    cmd.ensure_finalized()
+    cmd.run()
+    return so_path
+
+
+def _file_key(path: str) -> tuple[str, int, int]:
+    """Cache key for a file: changes whenever the file is rewritten."""
+    st = os.stat(path)
+    return (os.path.abspath(path), st.st_mtime_ns, st.st_size)
+
+
 class ModelBundleManager:
     """
     Loads and validates the *active* model bundle as defined in deployment.json.
@@ -26,6 +91,9 @@ class ModelBundleManager:
         self.labels: Optional[list] = None
         self.predictor: Optional[TFLitePredictor] = None
         self._preprocess_callable: Optional[Callable[[], np.ndarray]] = None
+        self._pp_accepts_out = False      # preprocessor can write into a given `out=` array
+        self._input_fn: Optional[Callable[..., np.ndarray]] = None   # built once per load
+        self._in_buf: Optional[np.ndarray] = None     # persistent input tensor (input_shape/dtype)
 
         # Shape/type info from manifest
         self.input_shape = None
@@ -35,18 +103,97 @@ class ModelBundleManager:
     # ---------- Filesystem utilities ----------
 
     def _read_json(self, path: str):
-        """Read and parse a JSON file from disk."""
-        with open(path, "r", encoding="utf-8") as f:
-            return json.load(f)
+        """
+        Read and parse a JSON file from disk (cached until the file changes).
+        Each call returns its own deep copy, so a caller (or preprocess.py) that
+        mutates the manifest can't corrupt later loads.
+        """
+        key = _file_key(path)
+        if key not in _JSON_CACHE:
+            # Small files: one raw read() syscall, no buffered/text io layers
+            fd = os.open(path, os.O_RDONLY)
+            try:
+                data = os.read(fd, key[2])
+            finally:
+                os.close(fd)
+            # Plain dicts/lists either way: the manifest is handed to preprocess.py as-is
+            _JSON_CACHE[key] = msgspec.json.decode(data) if msgspec else json.loads(data)
+        return copy.deepcopy(_JSON_CACHE[key])
 
-    def _sha256(self, path: str) -> str:
-        """Compute the SHA-256 checksum of a file."""
-        h = hashlib.sha256()
+    def _sha256(self, path: str, use_cache: bool = True) -> str:
+        """Compute the SHA-256 checksum of a file (cached until the file changes)."""
+        key = _file_key(path)
+        if use_cache and key in _SHA_CACHE:
+            return _SHA_CACHE[key]
         with open(path, "rb") as f:
-            for chunk in iter(lambda: f.read(8192), b""):
-                h.update(chunk)
+            if key[2] >= SHA_MMAP_MIN_BYTES:
+                h = hashlib.sha256()
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    h.update(mm)
+            elif hasattr(hashlib, "file_digest"):
+                # Python 3.11+: the read/update loop runs in C with a large buffer
+                h = hashlib.file_digest(f, "sha256")
+            else:
+                # Older Pythons: one reused 4 MiB buffer, no allocation per chunk
+                h = hashlib.sha256()
+                mv = memoryview(bytearray(4 * 1024 * 1024))
+                while n := f.readinto(mv):
+                    h.update(mv[:n])
+        _SHA_CACHE[key] = h.hexdigest()
+        return _SHA_CACHE[key]
+
+    def _blake3(self, path: str) -> str:
+        """Compute the BLAKE3 hash of a file (mmap'd, hashed by all cores)."""
+        if blake3 is None:
+            raise RuntimeError("model_hash_algo 'blake3' requires the blake3 package")
+        h = blake3.blake3(max_threads=blake3.blake3.AUTO)
+        h.update_mmap(path)
         return h.hexdigest()
 
+    def _model_hash(self, path: str, algo: str, use_cache: bool = True) -> str:
+        """Hash the model file with the manifest's algorithm ('sha256' or 'blake3')."""
+        if algo == "sha256":
+            return self._sha256(path, use_cache)
+        if algo == "blake3":
+            return self._blake3(path)
+        raise ValueError(f"Unsupported model_hash_algo: {algo}")
+
+    def _verified_hash(self, path: str, algo: str = "sha256") -> str:
+        """
+        `algo` hash (SHA-256 by default) of the model, remembered across restarts in
+        MODELS_DIR/.sha_cache.json under a stat fingerprint (device, inode, mtime, size).
+        An unchanged file costs one stat instead of a full read; any rewrite changes
+        the fingerprint.
+        """
+        st = os.stat(path)
+        fp = f"{st.st_dev}:{st.st_ino}:{st.st_mtime_ns}:{st.st_size}"
+        name = os.path.abspath(path)
+        if algo != "sha256":
+            name = f"{algo}:{name}"
+        side = os.path.join(self.cfg.MODELS_DIR, ".sha_cache.json")
+        try:
+            with open(side, "r", encoding="utf-8") as f:
+                cache = json.load(f)
+        except (OSError, ValueError):
+            cache = {}
+
+        entry = cache.get(name)
+        if isinstance(entry, dict) and entry.get("fp") == fp:
+            return entry["sha"]
+
+        sha = self._model_hash(path, algo)
+        cache[name] = {"fp": fp, "sha": sha}
+        try:
+            # Write a temp file and rename, so a crash never leaves half a sidecar
+            tmp = side + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(cache, f)
+            os.replace(tmp, side)
+        except OSError as e:
+            # Read-only models dir: verification still works, just not cached
+            print(f"[bundle] SHA cache not saved: {e}")
+        return sha
+
     # ---------- Public methods ----------
 
     def load_active_bundle(self) -> bool:
@@ -80,17 +227,27 @@ class ModelBundleManager:
         self.manifest = self._read_json(man_path)
         self.labels = self._read_json(lab_path)
 
-        # (Optional) Verify model file integrity using SHA-256
-        expected_sha = self.manifest.get("model_sha256")
-        if expected_sha:
-            actual_sha = self._sha256(mdl_path)
-            if actual_sha.lower() != expected_sha.lower():
+        # (Optional) Verify model file integrity using SHA-256 (or "model_hash_algo")
+        algo = self.manifest.get("model_hash_algo", "sha256")
+        if algo == "sha256":
+            expected_hash = self.manifest.get("model_hash") or self.manifest.get("model_sha256")
+        else:
+            # model_sha256 is a SHA-256 digest: never compare it against another algorithm
+            expected_hash = self.manifest.get("model_hash")
+            if not expected_hash:
+                raise ValueError(f"model_hash_algo '{algo}' requires 'model_hash' in the manifest")
+        if expected_hash:
+            actual_hash = self._verified_hash(mdl_path, algo)
+            if actual_hash.lower() != expected_hash.lower():
+                # Never fail on a remembered value alone: hash the file for real
+                actual_hash = self._model_hash(mdl_path, algo, use_cache=False)
+            if actual_hash.lower() != expected_hash.lower():
                 raise ValueError(
-                    f"Model SHA mismatch: got {actual_sha}, expected {expected_sha}"
+                    f"Model {algo} mismatch: got {actual_hash}, expected {expected_hash}"
                 )
 
         # Load the TensorFlow Lite model wrapper
-        self.predictor = TFLitePredictor(mdl_path)
+        self.predictor = TFLitePredictor(mdl_path, num_threads=self.cfg.TFLITE_THREADS)
 
         # Read shape/dtype info from manifest
         self.input_shape = tuple(self.manifest["input_shape"])
@@ -102,6 +259,13 @@ class ModelBundleManager:
                 f"Input shape mismatch: predictor {self.predictor.input_shape} vs manifest {self.input_shape}"
             )
 
+        # ...and on input dtype: inputs are cast once, to the manifest's dtype, and then
+        # written into the interpreter's tensor as-is
+        if np.dtype(self.predictor.input_dtype) != self.input_dtype:
+            raise ValueError(
+                f"Input dtype mismatch: predictor {np.dtype(self.predictor.input_dtype)} vs manifest {self.input_dtype}"
+            )
+
         # Verify that labels and manifest agree on number of classes
         self.num_classes = len(self.labels)
         if "num_classes" in self.manifest:
@@ -118,8 +282,12 @@ class ModelBundleManager:
         # Load the custom preprocessing function from preprocess.py
         self._load_plugin_preprocessor()
 
+        # One input buffer for the bundle's lifetime, then the input function that fills it
+        self._in_buf = np.empty(self.input_shape, dtype=self.input_dtype)
+        self._input_fn = self.get_input_fn()
+
         # Run a quick test: preprocessor output must match expected shape/dtype
-        test = self.get_input_fn()()
+        test = self._input_fn()
         if tuple(test.shape) != tuple(self.input_shape) or np.dtype(test.dtype) != self.input_dtype:
             raise ValueError(
                 f"Preprocessor produced {test.shape}, {test.dtype}; "
@@ -139,11 +307,18 @@ class ModelBundleManager:
         if not os.path.exists(pp_path):
             raise FileNotFoundError("preprocess.py not found (plugin mode)")
 
-        # Load Python module dynamically
-        spec = importlib.util.spec_from_file_location("bundle_preprocess", pp_path)
-        mod = importlib.util.module_from_spec(spec)
-        assert spec.loader is not None
-        spec.loader.exec_module(mod)
+        # Load Python module dynamically (once per version of the file)
+        use_cython = bool(self.manifest.get("preprocess_cython", False))
+        key = (os.path.abspath(pp_path), os.stat(pp_path).st_mtime_ns, use_cython)
+        mod = _PP_MOD_CACHE.get(key)
+        if mod is None and use_cython:
+            mod = self._load_cython_preprocessor(pp_path)
+        if mod is None:
+            spec = importlib.util.spec_from_file_location("bundle_preprocess", pp_path)
+            mod = importlib.util.module_from_spec(spec)
+            assert spec.loader is not None
+            spec.loader.exec_module(mod)
+        _PP_MOD_CACHE[key] = mod
 
         # Must define build_preprocessor() returning a callable that yields input tensors
         if not hasattr(mod, "build_preprocessor"):
@@ -154,31 +329,125 @@ class ModelBundleManager:
         # Build callable that returns preprocessed numpy array per prediction
         self._preprocess_callable = mod.build_preprocessor(self.reader_factory, self.cfg, self.manifest)
 
+        # Optional in-place contract: callable(out=array) fills `out` instead of returning
+        try:
+            self._pp_accepts_out = "out" in inspect.signature(self._preprocess_callable).parameters
+        except (TypeError, ValueError):
+            self._pp_accepts_out = False
+
+    def _load_cython_preprocessor(self, pp_path: str) -> Optional[ModuleType]:
+        """
+        Compile preprocess.py with Cython into <bundle>/_compiled/ and import the
+        extension. Returns None (→ plain Python module) if Cython or a C compiler is
+        missing, or the build fails. Note: an extension can't be unloaded, so a
+        recompiled plugin takes effect after the next restart.
+        """
+        if cythonize is None:
+            print("[bundle] preprocess_cython set but Cython is not installed; using Python")
+            return None
+        try:
+            so_path = _cython_build(pp_path, os.path.join(self.bundle_dir, "_compiled"))
+            name = os.path.splitext(os.path.basename(pp_path))[0]
+            spec = importlib.util.spec_from_file_location(name, so_path)
+            mod = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(mod)
+        except Exception as e:
+            print(f"[bundle] Cython build of preprocess.py failed, using Python: {e}")
+            return None
+        print(f"[bundle] Using compiled preprocessor: {so_path}")
+        return mod
+
     # ---------- API for predictor ----------
 
+    @property
+    def input_fn(self) -> Callable[..., np.ndarray]:
+        """The input function built once by load_active_bundle() (see get_input_fn())."""
+        if self._input_fn is None:
+            raise RuntimeError("Bundle not loaded or preprocessor missing")
+        return self._input_fn
+
     def get_input_fn(self) -> Callable[[], np.ndarray]:
         """
         Return a callable that generates one preprocessed input tensor.
-        This wraps the plugin preprocessor and ensures type/shape safety.
+        This wraps the plugin preprocessor and ensures type/shape safety: the result
+        always has exactly input_shape/input_dtype, so the predictor doesn't re-cast it.
+        Called as fn(out=array) it fills `out` (e.g. the interpreter's input tensor,
+        see TFLitePredictor.predict_inplace) and returns it; preprocessors that
+        accept `out=` write there directly, others are copied in once.
+        Called as fn(), it returns the manager's persistent input buffer, only valid
+        until the next call (the interpreter copies it), so nothing is allocated per call.
         """
         if self._preprocess_callable is None:
             raise RuntimeError("Bundle not loaded or preprocessor missing")
 
-        def _fn():
-            x = self._preprocess_callable()
+        if self.manifest.get("quantize_input"):
+            return self._quantizing_input_fn()
+
+        # Owned by the manager: in-place preprocessors fill it, and a dtype mismatch
+        # from older (returning) preprocessors is cast into it instead of a new array
+        if self._in_buf is None:
+            self._in_buf = np.empty(self.input_shape, dtype=self.input_dtype)
+        in_buf = self._in_buf
+        pp, accepts_out = self._preprocess_callable, self._pp_accepts_out
+
+        def _fn(out: Optional[np.ndarray] = None):
+            if accepts_out:
+                if out is None:
+                    out = in_buf
+                pp(out=out)
+                return out
+            x = pp()
             # Ensure dtype and shape exactly match what the model expects
-            if x.dtype != self.input_dtype:
-                x = x.astype(self.input_dtype, copy=False)
             if tuple(x.shape) != tuple(self.input_shape):
                 raise ValueError(f"Preprocessor produced {x.shape}; expected {self.input_shape}")
+            if out is not None:
+                np.copyto(out, x, casting='unsafe')
+                return out
+            if x.dtype != self.input_dtype:
+                np.copyto(in_buf, x, casting='unsafe')
+                x = in_buf
             return x
 
         return _fn
 
+    def _quantizing_input_fn(self) -> Callable[..., np.ndarray]:
+        """
+        Input function for manifests with "quantize_input": true — the preprocessor
+        produces float32 (returned, or written via out=) and the predictor quantizes
+        it with the model's input scale/zero-point into the int8/uint8 tensor.
+        """
+        pred = self.predictor
+        if not pred.input_quantized:
+            raise ValueError("quantize_input is set but the model input is not int8/uint8-quantized")
+        if self._in_buf is None:
+            self._in_buf = np.empty(self.input_shape, dtype=self.input_dtype)
+        qbuf = self._in_buf
+        fbuf = np.empty(self.input_shape, dtype=np.float32)   # float preprocessor output
+        pp, accepts_out = self._preprocess_callable, self._pp_accepts_out
+
+        def _fn(out: Optional[np.ndarray] = None):
+            if accepts_out:
+                pp(out=fbuf)
+                x = fbuf
+            else:
+                x = pp()
+                if tuple(x.shape) != tuple(self.input_shape):
+                    raise ValueError(f"Preprocessor produced {x.shape}; expected {self.input_shape}")
+            return pred.quantize_input(x, qbuf if out is None else out)
+
+        return _fn
+
     def predict_one(self):
         """
         Convenience helper: preprocess and run a single prediction.
         Returns the class index and probability distribution.
         """
-        x = self.get_input_fn()()
-        return self.predictor.predict_one(lambda: x)
+        if self._input_fn is None:
+            raise RuntimeError("Bundle not loaded or preprocessor missing")
+        return self.predictor.predict_one_array(self._input_fn())
+
+    def predict_class(self) -> int:
+        """Like predict_one(), for callers that only need the class index."""
+        if self._input_fn is None:
+            raise RuntimeError("Bundle not loaded or preprocessor missing")
+        return self.predictor.predict_class_only(self._input_fn)
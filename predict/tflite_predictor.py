@@ -7,16 +7,71 @@ try:
 except ImportError:
     from tensorflow.lite.python.interpreter import Interpreter  # type: ignore
 
+# Prefer a Numba kernel for the output softmax (max, exp+sum and normalize in
+# three tight loops, no temporaries). Without Numba, use the NumPy version.
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+
+if njit is not None:
+    @njit(cache=True, fastmath=True)
+    def _softmax(y):
+        m = y[0]
+        for v in y:
+            if v > m:
+                m = v
+        # exp + sum in one pass, then normalize in place
+        out = np.empty_like(y)
+        t = 0.0
+        for i in range(y.size):
+            e = np.exp(y[i] - m)
+            out[i] = e
+            t += e
+        inv = 1.0 / (t + 1e-12)
+        for i in range(y.size):
+            out[i] *= inv
+        return out
+else:
+    def _softmax(y):
+        e = np.exp(y - np.max(y))
+        e /= np.sum(e) + 1e-12
+        return e
+
+
+def _looks_like_logits(y: np.ndarray) -> bool:
+    # Heuristic: if sum is not ~1.0 or any value is negative, treat as logits
+    return not np.allclose(np.sum(y), 1.0, atol=1e-3) or bool(np.any(y < 0))
+
+
+def _new_interpreter(model_path: str, num_threads: int | None) -> Interpreter:
+    # num_threads > 1 lets the XNNPACK CPU kernels (default in recent TFLite builds) fan out
+    try:
+        return Interpreter(model_path=model_path, num_threads=num_threads)
+    except TypeError:
+        # Old tflite_runtime without the num_threads argument
+        return Interpreter(model_path=model_path)
+
 
 class TFLitePredictor:
     """
     Minimal wrapper around a TensorFlow Lite model for single-step predictions.
     - Loads the model, allocates tensors, and caches input/output details.
     - Provides predict_one(get_input_fn) that returns (class_index, probabilities).
+    - predict_many(get_input_fn, batch) runs several inputs through one invoke().
+    - predict_inplace(fill_input_fn) lets the caller write straight into the
+      interpreter's input tensor (no set_tensor copy).
+    - predict_one_int8(get_raw_float_fn) quantizes a float input for int8/uint8 models.
+    - predict_class_only / predict_class_inplace / predict_classes_many return just
+      the class index (argmax of the raw output; softmax never changes it).
     """
-    def __init__(self, model_path: str):
+    def __init__(self, model_path: str, num_threads: int | None = None):
         # Create the interpreter for the given TFLite model and allocate buffers
-        self.interp = Interpreter(model_path=model_path)
+        # (one per predictor: an Interpreter and its tensor views are not thread-safe)
+        self.model_path = model_path
+        self.num_threads = num_threads
+        self.interp = _new_interpreter(model_path, num_threads)
         self.interp.allocate_tensors()
 
         # Cache the first (and usually only) input/output tensor details
@@ -28,35 +83,202 @@ class TFLitePredictor:
         self.input_dtype = self.inp["dtype"]
         self.output_dtype = self.out["dtype"]
 
+        # Callables returning numpy views of the interpreter's own input/output buffers
+        self._in_view = self.interp.tensor(self.inp["index"])
+        self._out_view = self.interp.tensor(self.out["index"])
+
+        # Batched path (predict_many): a second interpreter resized to (batch, ...),
+        # created on first use; None/False until then / if the model can't be resized
+        self._batch_interp = None
+        self._batch_x = None
+        self._batch_ok = self.input_shape[0] == 1
+
+        # Quantization parameters (scale 0.0 = float tensor). Quantized models move
+        # 1 byte per input value instead of 4 and run on the int8 NEON kernels.
+        self.input_scale, self.input_zero_point = self.inp.get("quantization", (0.0, 0))
+        self.input_quantized = np.dtype(self.input_dtype).kind in "iu" and self.input_scale > 0
+        self._out_scale, self._out_zero_point = self.out.get("quantization", (0.0, 0))
+        self._q_tmp = None   # float32 scratch for quantize_input(), allocated on first use
+
+        # Softmax or logits? Decided once by a dry run, not per prediction
+        self._needs_softmax = self._probe_needs_softmax()
+
+    def _probe_needs_softmax(self) -> bool:
+        """Run one inference on an all-zero input; True if the output looks like logits."""
+        view = self._in_view()
+        view.fill(0)
+        del view
+        self.interp.invoke()
+        y = self._dequantize_output(np.squeeze(self.interp.get_tensor(self.out["index"])))
+        return _looks_like_logits(y)
+
     def predict_one(self, get_input_fn) -> tuple[int, np.ndarray]:
         """
         Run a single forward pass.
-        - get_input_fn() must return a NumPy array with shape == self.input_shape.
+        - get_input_fn() must return a NumPy array with exactly self.input_shape and
+          self.input_dtype (ModelBundleManager.get_input_fn() guarantees both).
         - Returns (pred_class_index, probs), where probs is a 1D softmax vector.
         """
-        # Retrieve and ensure the input is the exact dtype the model expects
-        x = get_input_fn().astype(self.input_dtype, copy=False)
+        return self.predict_one_array(get_input_fn())
 
-        # Strict shape check for safety
-        if tuple(x.shape) != tuple(self.input_shape):
-            raise ValueError(f"Bad input shape: got {x.shape}, expected {self.input_shape}")
+    def predict_one_array(self, x: np.ndarray) -> tuple[int, np.ndarray]:
+        """Same as predict_one(), for an input array that is already at hand."""
+        # The input function already cast/checked x; re-check only in debug runs (not under -O)
+        if __debug__ and (x.dtype != self.input_dtype or tuple(x.shape) != self.input_shape):
+            raise ValueError(
+                f"Bad input: got {x.shape} {x.dtype}, expected {self.input_shape} {self.input_dtype}"
+            )
 
         # Feed the input tensor and invoke the model
         self.interp.set_tensor(self.inp["index"], x)
         self.interp.invoke()
+        return self._read_output()
 
-        # Read the output tensor; shape is typically (1, C) or (C,)
-        y = self.interp.get_tensor(self.out["index"])
-        y = np.squeeze(y)  # ensure 1D if it was (1, C)
+    def predict_inplace(self, fill_input_fn) -> tuple[int, np.ndarray]:
+        """
+        Like predict_one(), but fill_input_fn(out) writes the input directly into
+        the interpreter's input tensor (`out` has shape/dtype == input_shape/dtype),
+        saving one tensor-sized copy per prediction.
+        fill_input_fn must not keep a reference to `out`: TFLite refuses to invoke()
+        while views of its buffers are alive.
+        """
+        view = self._in_view()
+        fill_input_fn(view)
+        del view
+        self.interp.invoke()
+        return self._read_output()
 
-        # If the model outputs logits (not normalized), apply softmax
-        if y.ndim == 1:
-            # Heuristic: if sum is not ~1.0 or any value is negative, treat as logits
-            if not np.allclose(np.sum(y), 1.0, atol=1e-3) or np.any(y < 0):
-                e = np.exp(y - np.max(y))
-                y = e / (np.sum(e) + 1e-12)
-        else:
-            raise ValueError(f"Unexpected output shape: {y.shape}")
+    def quantize_input(self, x: np.ndarray, out: np.ndarray) -> np.ndarray:
+        """
+        Write round(x / scale) + zero_point, clipped to the input dtype's range, into
+        `out` (an int8/uint8 array of input_shape). In-place ufuncs on one reused
+        float32 scratch buffer: no temporaries per call.
+        """
+        if not self.input_quantized:
+            raise ValueError(f"Model input is not quantized ({np.dtype(self.input_dtype).name})")
+        if self._q_tmp is None:
+            self._q_tmp = np.empty(self.input_shape, dtype=np.float32)
+        t, info = self._q_tmp, np.iinfo(self.input_dtype)
+        np.multiply(x, 1.0 / self.input_scale, out=t)
+        np.rint(t, out=t)
+        t += self.input_zero_point
+        np.clip(t, info.min, info.max, out=t)
+        np.copyto(out, t, casting='unsafe')
+        return out
+
+    def predict_one_int8(self, get_raw_float_fn) -> tuple[int, np.ndarray]:
+        """
+        Like predict_one(), for a quantized model fed by a float preprocessor:
+        get_raw_float_fn() returns float input of input_shape, which is quantized
+        straight into the interpreter's input tensor.
+        """
+        view = self._in_view()
+        self.quantize_input(get_raw_float_fn(), view)
+        del view
+        self.interp.invoke()
+        return self._read_output()
+
+    def predict_class_only(self, get_input_fn) -> int:
+        """Like predict_one(), but return only the class index (no probabilities)."""
+        self.interp.set_tensor(self.inp["index"], get_input_fn())
+        self.interp.invoke()
+        return self._read_class()
+
+    def predict_class_inplace(self, fill_input_fn) -> int:
+        """Like predict_inplace(), but return only the class index (no probabilities)."""
+        view = self._in_view()
+        fill_input_fn(view)
+        del view
+        self.interp.invoke()
+        return self._read_class()
+
+    def _read_class(self) -> int:
+        # argmax straight on the output tensor view: softmax and (scale > 0) dequantization
+        # are monotonic, so the raw scores give the same class without computing them
+        return int(self._out_view().argmax())
+
+    def _dequantize_output(self, y: np.ndarray) -> np.ndarray:
+        # Integer outputs of a quantized model → real values, so the softmax heuristic sees them
+        if self._out_scale > 0 and y.dtype.kind in "iu":
+            y = (y.astype(np.float32) - self._out_zero_point) * np.float32(self._out_scale)
+        return y
+
+    def _read_output(self) -> tuple[int, np.ndarray]:
+        # View the output tensor (no get_tensor copy); shape is typically (1, C) or (C,)
+        yv = np.squeeze(self._out_view())  # ensure 1D if it was (1, C)
+        if yv.ndim != 1:
+            raise ValueError(f"Unexpected output shape: {yv.shape}")
+
+        y = self._to_probs(self._dequantize_output(yv))
+        if y is yv:
+            # Already probabilities: copy the (small) vector out, since TFLite refuses
+            # to invoke() while views of its buffers are alive
+            y = yv.copy()
+        del yv
 
         # Return the argmax class index and the probability vector
-        return int(np.argmax(y)), y
+        return int(y.argmax()), y
+
+    def _to_probs(self, y: np.ndarray) -> np.ndarray:
+        # If the model outputs logits (not normalized), apply softmax
+        if not self._needs_softmax:
+            return y
+        if y.dtype.kind != "f":
+            y = y.astype(np.float32)
+        return _softmax(y)
+
+    def _open_batch(self, batch: int) -> bool:
+        """Create (or re-create) the batch interpreter; False if the model has a fixed batch."""
+        try:
+            interp = _new_interpreter(self.model_path, self.num_threads)
+            shape = (batch,) + self.input_shape[1:]
+            interp.resize_tensor_input(interp.get_input_details()[0]["index"], shape)
+            interp.allocate_tensors()
+        except (ValueError, RuntimeError) as e:
+            print(f"[predict] batching unavailable, falling back to single inference: {e}")
+            return False
+        self._batch_interp = interp
+        self._batch_io = (interp.get_input_details()[0]["index"], interp.get_output_details()[0]["index"])
+        self._batch_x = np.empty(shape, dtype=self.input_dtype)   # reused for every batch
+        return True
+
+    def predict_many(self, get_input_fn, batch: int = 4) -> list[tuple[int, np.ndarray]]:
+        """
+        Gather `batch` inputs from get_input_fn() and run them through one invoke()
+        of a batch-resized interpreter, amortizing per-invoke overhead.
+        Returns one (pred_class_index, probs) per input, in order. Falls back to
+        repeated predict_one() if the model's batch dimension can't be resized.
+        """
+        ys = self._invoke_batch(get_input_fn, batch)
+        if ys is None:
+            return [self.predict_one(get_input_fn) for _ in range(batch)]
+        ys = self._dequantize_output(ys)
+        return [(int(np.argmax(p)), p) for p in map(self._to_probs, ys)]
+
+    def predict_classes_many(self, get_input_fn, batch: int = 4) -> list[int]:
+        """Like predict_many(), but return only the class index per input."""
+        ys = self._invoke_batch(get_input_fn, batch)
+        if ys is None:
+            return [self.predict_class_only(get_input_fn) for _ in range(batch)]
+        return ys.argmax(axis=1).tolist()
+
+    def _invoke_batch(self, get_input_fn, batch: int) -> np.ndarray | None:
+        """Run `batch` inputs through the batch interpreter; raw (batch, C) output, or None if unavailable."""
+        if self._batch_ok and (self._batch_x is None or self._batch_x.shape[0] != batch):
+            self._batch_ok = self._open_batch(batch)
+        if not self._batch_ok:
+            return None
+
+        # Stack the inputs into the preallocated batch tensor
+        xs = self._batch_x
+        for i in range(batch):
+            x = get_input_fn()
+            if tuple(x.shape) != tuple(self.input_shape):
+                raise ValueError(f"Bad input shape: got {x.shape}, expected {self.input_shape}")
+            xs[i] = x[0]
+
+        interp = self._batch_interp
+        in_idx, out_idx = self._batch_io
+        interp.set_tensor(in_idx, xs)
+        interp.invoke()
+        return interp.get_tensor(out_idx).reshape(batch, -1)
@@ -19,6 +19,14 @@ except ImportError:
             # No-op in the stub
             pass
 
+        def set_pixels(self, pixels):
+            # No-op in the stub
+            pass
+
+
+# Fixed 8x8 geometry, row-major (set_pixels order): True on the 28 outer-ring pixels
+_BORDER_MASK = tuple(x in (0, 7) or y in (0, 7) for y in range(8) for x in range(8))
+
 
 class SenseUI:
     """
@@ -26,20 +34,46 @@ class SenseUI:
     - fill(name): fill the whole matrix with a named color from the palette
     - draw_pred_class(idx, palette, border_name): draw a white border and fill
       the inside with a class color based on index
+    Hot paths can resolve a color name once with color_idx(name) and then use
+    fill_idx(i) / draw_pred_class(..., border_idx=i) (list indexing, no dict lookups).
     """
     def __init__(self, colors: dict):
         # Store the device handle and a mapping of color names → RGB tuples
         self.sense = SenseHat()
         self.c = colors
 
+        # Integer-indexed color table: name -> index, index -> RGB
+        self._color_index = {name: i for i, name in enumerate(colors)}
+        self._color_table = list(colors.values())
+
+        # Prebuilt 64-pixel frames per color index, so fill() is a single set_pixels()
+        self._fills = [[rgb] * 64 for rgb in self._color_table]
+        self._last_fill: int | None = None   # index of the solid fill on the matrix, if any
+
+        # Bordered class frames, built on first use: (border_idx, id(palette), index) -> 64 pixels
+        self._frames: dict[tuple[int, int, int], list[tuple[int, int, int]]] = {}
+
+    def color_idx(self, name: str) -> int:
+        """Index of a named color, for fill_idx() and draw_pred_class(border_idx=...)."""
+        return self._color_index[name]
+
     def fill(self, name: str):
         """
         Fill the entire LED matrix with a named color.
         The name must exist as a key in the provided color dictionary.
+        Repeating the current fill is a no-op.
         """
-        self.sense.clear(self.c[name])
+        self.fill_idx(self._color_index[name])
+
+    def fill_idx(self, i: int):
+        """Same as fill(), with the color given by its index (see color_idx())."""
+        if i == self._last_fill:
+            return
+        self.sense.set_pixels(self._fills[i])
+        self._last_fill = i
 
-    def draw_pred_class(self, cls_idx: int, palette: list[tuple[int, int, int]], border_name: str = "WHITE"):
+    def draw_pred_class(self, cls_idx: int, palette: list[tuple[int, int, int]], border_name: str = "WHITE",
+                        border_idx: int | None = None):
         """
         Draw a white border and fill with a class color selected by cls_idx.
 
@@ -47,30 +81,27 @@ class SenseUI:
         "White border + fill color from palette based on cls_idx (wrap with modulo)."
 
         Behavior:
-        - Clears the matrix first (safety reset)
-        - Draws a 1-pixel border in the named border color (default: WHITE)
+        - Draws a 1-pixel border in the named border color (default: WHITE),
+          or in color border_idx when given (skips the name lookup)
         - Picks the interior color from the given palette using cls_idx % len(palette)
         - Fills the 6x6 interior area with that color
+        The whole frame goes out in one set_pixels() call instead of 68 set_pixel() calls.
+        It covers all 64 pixels, so there is no clear() first; call fill("OFF") for a blank matrix.
         """
         s = self.sense
-
-        # Clear any previous drawing to avoid leftover pixels
-        s.clear()
-
-        # Get the RGB color for the border (defaults to WHITE if not changed)
-        border = self.c[border_name]
-
-        # Draw the 8x8 border: top, bottom, left, right edges
-        for i in range(8):
-            s.set_pixel(i, 0, border)  # top row
-            s.set_pixel(i, 7, border)  # bottom row
-            s.set_pixel(0, i, border)  # left column
-            s.set_pixel(7, i, border)  # right column
+        self._last_fill = None   # the matrix no longer shows a solid fill
 
         # Choose an interior color based on class index (safe modulo range)
-        color = palette[cls_idx % len(palette)]
+        idx = cls_idx % len(palette)
+        if border_idx is None:
+            border_idx = self._color_index[border_name]
+        key = (border_idx, id(palette), idx)
+        frame = self._frames.get(key)
+        if frame is None:
+            frame = self._frames[key] = self._build_frame(self._color_table[border_idx], palette[idx])
+        s.set_pixels(frame)
 
-        # Fill the 6x6 interior area (coordinates 1..6 inclusive)
-        for x in range(1, 7):
-            for y in range(1, 7):
-                s.set_pixel(x, y, color)
+    @staticmethod
+    def _build_frame(border, color) -> list[tuple[int, int, int]]:
+        # Outer ring in the border color, 6x6 interior in `color`
+        return [border if edge else color for edge in _BORDER_MASK]